@@ -126,8 +126,8 @@ class Camera(Sensor):
         self._move_viewcone(robot_pose)
         self._rescale_viewcone(robot_pose)
 
-        # Translate detection model
-        self.detection_model.move(self.view_pose)
+        # Place the detection model at the camera's pose
+        self.detection_model.set_frame(self.view_pose)
 
     def _move_viewcone(self, robot_pose):
         """Move the viewcone based on the robot's pose
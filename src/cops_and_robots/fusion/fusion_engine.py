@@ -59,6 +59,10 @@ class FusionEngine(object):
         The number of particles used for a particle filter. This is the number
         used for the `combined` model, which is distributed among all other
         models. Default is 2000.
+    vb_cfg : dict, optional
+        Keyword arguments for the `VariationalBayes` used by gauss sum
+        filters (e.g. `num_workers` and `seed` for parallel, reproducible
+        VBIS fusion).
 
     """
 
@@ -71,6 +75,7 @@ class FusionEngine(object):
                  rosbag_process=None,
                  use_velocity=True,
                  use_STM=True,
+                 vb_cfg=None,
                  ):
 
         self.probability_type = probability_type
@@ -110,9 +115,11 @@ class FusionEngine(object):
             for name in missing_robber_names:
                 self.filters[name] = GaussSumFilter(target_name=name,
                                                     feasible_layer=feasible_layer, 
-                                                    rosbag_process=rosbag_process)
+                                                    rosbag_process=rosbag_process,
+                                                    vb_cfg=vb_cfg)
             if len(missing_robber_names) > 1:
-                self.filters['combined'] = GaussSumFilter('combined', feasible_layer)
+                self.filters['combined'] = GaussSumFilter('combined', feasible_layer,
+                                                          vb_cfg=vb_cfg)
         else:
             raise ValueError("FusionEngine must be of type 'grid', 'particle'"
                              "or 'gauss sum'.")
@@ -156,7 +163,7 @@ class FusionEngine(object):
             try:
                 prob *= filter_.probability.prob
             except NameError:
-                prob = filter_.probability.copy().prob
+                prob = np.array(filter_.probability.prob)
         prob /= prob.sum()
         self.filters['combined'].probability.prob = prob
 
@@ -50,6 +50,7 @@ class GaussSumFilter(Filter):
                  fusion_method='sequential',
                  compression_method='geometric',
                  window=1,
+                 vb_cfg=None,
                  *args,
                  **kwargs
                  ):
@@ -60,8 +61,23 @@ class GaussSumFilter(Filter):
         self.compression_method = compression_method
         self.window = window
 
-        # Set up the VB fusion parameters
-        self.vb = VariationalBayes()
+        # Set up the VB fusion parameters, used for every update of the
+        # belief (camera and human alike)
+        if vb_cfg is None:
+            vb_cfg = {}
+        self.vb = VariationalBayes(**vb_cfg)
+        self.probability = self.probability
+
+    @property
+    def probability(self):
+        return self._probability
+
+    @probability.setter
+    def probability(self, probability):
+        # Any new belief uses the filter's VB fusion parameters
+        if hasattr(self, 'vb') and isinstance(probability, GaussianMixture):
+            probability.vb = self.vb
+        self._probability = probability
 
     def _human_update(self, human_sensor):
 
@@ -157,7 +173,9 @@ class GaussSumFilter(Filter):
         raw_weights = []
         for u, mixand_weight in enumerate(prior.weights):
 
-            prior_mixand = GaussianMixture(1, prior.means[u], prior.covariances[u])
+            prior_mixand = GaussianMixture.from_arrays(np.ones(1),
+                                                       prior.means[u:u + 1],
+                                                       prior.covariances[u:u + 1])
 
             for i, likelihood in enumerate(likelihoods):
 
@@ -14,7 +14,9 @@ __maintainer__ = "Nick Sweet"
 __email__ = "nick.sweet@colorado.edu"
 __status__ = "Development"
 
+import heapq
 import logging
+import itertools
 import os
 import time
 from copy import deepcopy
@@ -28,9 +30,9 @@ from scipy.linalg import block_diag
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 from descartes.patch import PolygonPatch
-from shapely.geometry import Polygon
+from shapely.geometry import Point, Polygon
 
-from cops_and_robots.fusion.probability import Probability
+from cops_and_robots.fusion.probability import Probability, shared_grid
 
 
 # <>TODO: test for greater than 2D mixtures
@@ -66,10 +68,42 @@ class GaussianMixture(Probability):
         attr_description
 
     """
+    # Upper bound on the (mixands x points x dims) temporary array used by
+    # `pdf`, so that 4D grids are evaluated in chunks instead of all at once
+    max_pdf_chunk_elements = 2 ** 22
 
     def __init__(self, weights=1, means=0, covariances=1, ellipse_color='red',
                  max_num_mixands=20, bounds=None, pos=None, pos_all=None):
+        self._set_attributes(weights, means, covariances, ellipse_color,
+                             max_num_mixands, bounds, pos, pos_all)
+        self._input_check()
+
+    @classmethod
+    def from_arrays(cls, weights, means, covariances, validate=False,
+                    merge=False, ellipse_color='red', max_num_mixands=20,
+                    bounds=None, pos=None, pos_all=None):
+        """Create a mixture from already formatted parameter arrays.
+
+        Unlike the constructor, this doesn't merge mixands unless `merge` is
+        set, and doesn't check its inputs unless `validate` is set. Trusted
+        inputs must have normalized weights (n), means (n x ndims) and
+        symmetric covariances (n x ndims x ndims).
+        """
+        gm = cls.__new__(cls)
+        gm._set_attributes(weights, means, covariances, ellipse_color,
+                           max_num_mixands, bounds, pos, pos_all)
+        if validate:
+            gm._input_check(merge=merge)
+        else:
+            gm.ndims = gm.means.shape[1]
+            if merge:
+                gm._merge()
+        return gm
+
+    def _set_attributes(self, weights, means, covariances, ellipse_color,
+                        max_num_mixands, bounds, pos, pos_all):
         self._prob_requires_update = True
+        self._factor_cache = {}
         self.weights = np.asarray(weights, dtype=np.float)
         self.means = np.asarray(means, dtype=np.float)
         self.covariances = np.asarray(covariances, dtype=np.float)
@@ -81,11 +115,19 @@ class GaussianMixture(Probability):
             self.pos = pos
         if pos_all is not None:
             self.pos_all = pos_all
-        self._input_check()
 
-        # Set up the VB fusion parameters
-        from cops_and_robots.fusion.variational_bayes import VariationalBayes
-        self.vb = VariationalBayes()
+    @property
+    def vb(self):
+        # Lazily set up the VB fusion parameters
+        if not hasattr(self, '_vb'):
+            from cops_and_robots.fusion.variational_bayes import \
+                VariationalBayes
+            self._vb = VariationalBayes()
+        return self._vb
+
+    @vb.setter
+    def vb(self, vb):
+        self._vb = vb
 
     def __str__(self):
         return 'Gaussian Mixture ({} mixands)'.format(self.weights.size)
@@ -130,6 +172,7 @@ class GaussianMixture(Probability):
 
                 self._prob_requires_update = True
         self._means = means
+        self._factor_cache = {}
 
     @property
     def covariances(self):
@@ -144,6 +187,7 @@ class GaussianMixture(Probability):
 
                 self._prob_requires_update = True
         self._covariances = covariances
+        self._factor_cache = {}
 
     def update(self, weights=None, means=None, covariances=None,
                gaussian_mixture=None):
@@ -171,6 +215,9 @@ class GaussianMixture(Probability):
         input and the dimensionality of the normal distribution. For example, 
         if x is 5x2 with a 2-dimensional normal distribution, pdf is 5x1; 
         if x is 5x5x2 with a 2-dimensional normal distribution, pdf is 5x5.
+
+        All mixands are evaluated together using cached covariance factors
+        (see `_get_factors`), in chunks of at most `max_pdf_chunk_elements`.
         """
 
         # Look over the whole state space
@@ -193,76 +240,154 @@ class GaussianMixture(Probability):
         else:
             shape = x.shape
 
-        # print shape
-        pdf = np.zeros(shape)
-        for i, weight in enumerate(self.weights):
-            if dims is None:
-                mean = self.means[i]
-                covariance = self.covariances[i]
-            else:
-                mean = [self.means[i][j] for j in dims]
-                covariance = [self.covariances[i][j, k] for j in dims for k in dims]
-                covariance = np.reshape(covariance, [len(dims), len(dims)])
-
-            gaussian_pdf = multivariate_normal.pdf(x, mean, covariance,
-                                                   allow_singular=True)
-            pdf += weight * gaussian_pdf
-
-        return pdf
+        means, _, whitening, log_norm, null_space = self._get_factors(dims)
+        k = means.shape[1]
+        points = np.reshape(x, (-1, k))
+        n_points = points.shape[0]
+
+        # Express every mixand's exponent as a linear function of quadratic
+        # features of the points (centered to limit cancellation error)
+        center = means.mean(axis=0)
+        precisions = np.einsum('nji,njk->nik', whitening, whitening)
+        coefficients = quadratic_coefficients(precisions, means - center)
+        with np.errstate(divide='ignore'):
+            coefficients[:, -1] -= 2 * (log_norm + np.log(self.weights))
+
+        # Evaluate all mixands over chunks of the query points
+        n_features = coefficients.shape[1]
+        chunk_size = max(1, self.max_pdf_chunk_elements
+                         // (self.weights.size * n_features))
+        pdf = np.empty(n_points)
+        for start in range(0, n_points, chunk_size):
+            stop = min(start + chunk_size, n_points)
+            features = quadratic_features(points[start:stop] - center)
+            log_pdfs = -0.5 * features.dot(coefficients.T)
+
+            # Singular mixands have no density off their support
+            if null_space is not None:
+                basis, tol = null_space
+                diff = points[None, start:stop, :] - means[:, None, :]
+                residual = np.einsum('nji,nmj->nmi', basis, diff)
+                residual = np.sqrt(np.einsum('nmi,nmi->nm',
+                                             residual, residual))
+                log_pdfs[(residual >= 1E3 * tol).T] = -np.inf
+
+            pdf[start:stop] = np.exp(log_pdfs).sum(axis=1)
+
+        return pdf.reshape(shape)
+
+    def _get_factors(self, dims=None):
+        """Return cached means and covariance factors over `dims`.
+
+        Factorizes every mixand's covariance at once, over the dimensions
+        `dims` (all dimensions by default). The cache is cleared whenever
+        means or covariances change.
+        """
+        if dims is None:
+            key = None
+        else:
+            key = tuple(dims)
 
-    def marginal_pdf(self, axis, x=None, dims=None):
+        try:
+            return self._factor_cache[key]
+        except KeyError:
+            pass
 
-        #<>TODO: fix for n-dimensional PDFs
-        x_min = np.min(x)
-        x_max = np.max(x)
-        if self.bounds is None:
-            bounds = [x_min, x_min, x_max, x_max]
+        if dims is None:
+            means = self.means
+            covariances = self.covariances
         else:
-            if axis == 0:
-                bounds = [self.bounds[0], x_min, self.bounds[2], x_max]
-            elif axis == 1:
-                bounds = [x_min, self.bounds[1], x_max, self.bounds[3]]
-            else:
-                raise NotImplementedError("Not yet implemented for n>2!")
+            dims = list(dims)
+            means = self.means[:, dims]
+            covariances = self.covariances[:, dims][:, :, dims]
+
+        factors = (means,) + factorize_covariances(covariances)
+        self._factor_cache[key] = factors
+        return factors
 
-        res = (x_max - x_min) / (x.size - 1)
-        self._discretize(bounds, res=res)
-        full_pdf = self.pdf(self.pos_all, dims)
+    def marginal(self, dims):
+        """Marginalize the mixture onto the dimensions `dims`.
 
-        # <>TODO: fix this axis hack
-        axis = 1 - axis
+        Gaussian mixtures marginalize exactly, by keeping each mixand's
+        sub-mean and sub-covariance over `dims`.
+        """
+        dims = list(np.atleast_1d(dims))
+
+        bounds = None
+        if self.bounds is not None:
+            n = len(self.bounds) // 2
+            if all(d < n for d in dims):
+                bounds = [self.bounds[d] for d in dims] \
+                    + [self.bounds[n + d] for d in dims]
+
+        return GaussianMixture(self.weights.copy(),
+                               self.means[:, dims],
+                               self.covariances[:, dims][:, :, dims],
+                               ellipse_color=self.ellipse_color,
+                               max_num_mixands=self.max_num_mixands,
+                               bounds=bounds)
 
-        return full_pdf.sum(axis=axis)
+    def marginal_pdf(self, axis, x=None, dims=None):
+        """Evaluate the marginal pdf over one or more axes at x.
 
-    def rvs(self, size=1):
+        If `dims` is given, `axis` indexes into `dims` rather than into all
+        of the mixture's dimensions.
         """
+        if dims is not None:
+            axis = np.asarray(dims)[axis]
+        return self.marginal(axis).pdf(x)
+
+    def rvs(self, size=1, random_state=None, out=None):
+        """Draw random samples from the mixture.
+
+        Mixand indices are drawn all at once by inverting the cumulative
+        weights, and the cached covariance square roots are applied to
+        standard normal draws in one batched product.
+
+        Parameters
+        ----------
+        size : int, optional
+            Number of samples.
+        random_state : numpy.random.Generator or RandomState, optional
+            Source of randomness. Defaults to the global `np.random` state.
+        out : array_like, optional
+            Preallocated (size x ndims) array, or (size,) for univariate
+            mixtures, to write the samples into.
         """
-        c_weights = self.weights.cumsum()  # Cumulative weights
-        c_weights = np.hstack([0, c_weights])
-        r_weights = np.random.rand(size)  # Randomly sampled weights
-        r_weights = np.sort(r_weights)
+        if random_state is None:
+            random_state = np.random
 
-        if self.ndims > 1:
-            rvs = np.zeros((size, self.ndims))
+        if out is None:
+            if self.ndims > 1:
+                out = np.empty((size, self.ndims))
+            else:
+                out = np.empty(size)
+        elif out.shape != (size, self.ndims) \
+                and not (self.ndims == 1 and out.shape == (size,)):
+            raise ValueError('Output array should have shape {}, not {}.'
+                             .format((size, self.ndims), out.shape))
+
+        # Write straight into the output unless it can't be viewed as
+        # (size x ndims) without a copy
+        if out.flags.c_contiguous:
+            rvs = out.reshape(size, self.ndims)
         else:
-            rvs = np.zeros(size)
-        prev_max = 0
-        for i, c_weight in enumerate(c_weights):
-            if i == c_weights.size - 1:
-                break
-
-            size_i = r_weights[r_weights > c_weight].size
-            size_i = size_i - r_weights[r_weights > c_weights[i + 1]].size
-            range_ = np.arange(size_i) + prev_max
-            range_ = range_.astype(int)
+            rvs = np.empty((size, self.ndims))
 
-            prev_max = range_[-1]
-            mean = self.means[i]
-            covariance = self.covariances[i]
+        # Pick a mixand for each sample
+        c_weights = self.weights.cumsum()
+        u = random_state.uniform(size=size) * c_weights[-1]
+        mixand_ids = np.searchsorted(c_weights, u, side='right')
+        mixand_ids = np.minimum(mixand_ids, self.weights.size - 1)
 
-            rvs[range_] = multivariate_normal.rvs(mean, covariance, size_i)
+        means, sqrt_covariances, _, _, _ = self._get_factors()
+        z = random_state.standard_normal((size, self.ndims))
+        np.einsum('nij,nj->ni', sqrt_covariances[mixand_ids], z, out=rvs)
+        rvs += means[mixand_ids]
+        if not out.flags.c_contiguous:
+            out[...] = rvs.reshape(out.shape)
 
-        return rvs
+        return out
 
     def measurement_update(self, likelihood, measurement_label, **kwargs):
         """Perform a Bayes' update using VBIS.
@@ -307,47 +432,40 @@ class GaussianMixture(Probability):
 
     def dynamics_update(self, impose_constraints=False, n_steps=1,
                         velocity_state=None):
-        #<>TODO: deal with n_steps
+        """Predict all mixands forward with a constant-velocity model.
+
+        Positional (2D) mixtures are padded with a velocity distribution --
+        the moment-matched `velocity_state` if given, otherwise zero-mean
+        with variance 5 -- which is held for all `n_steps` before being
+        marginalized out again.
+        """
         if velocity_state is None:
             v = np.array([0, 0])
-            v_std = 5
-
-        dt = 0.1
-        F = np.array([[1, 0, dt, 0],
-                      [0, 1, 0, dt],
-                      [0, 0, 1, 0],
-                      [0, 0, 0, 1]])
-
-        Gamma = np.array([[0.5*dt**2, 0],
-                          [0, 0.5*dt**2],
-                          [dt, 0],
-                          [0, dt]])
-        Q = np.eye(2) * 1.5
+            v_covariance = np.eye(2) * 5
+        else:
+            v = velocity_state.weights .dot (velocity_state.means)
+            d = velocity_state.means - v
+            v_covariance = np.einsum('n,nij->ij', velocity_state.weights,
+                                     velocity_state.covariances
+                                     + d[:, :, None] * d[:, None, :])
+
+        F, Q = constant_velocity_model(n_steps)
+
+        # Pad means and covariances
+        n, m = self.means.shape
+        if m < F.shape[0]:
+            means = np.hstack((self.means, np.tile(v, (n, 1))))
+            covariances = np.zeros((n,) + F.shape)
+            covariances[:, :m, :m] = self.covariances
+            covariances[:, m:, m:] = v_covariance
+        else:
+            means = self.means
+            covariances = self.covariances
 
         # Time update
-        #<>TODO: include velocity states
-        means = np.empty_like(self.means)
-        for i, mean in enumerate(self.means):
-
-            # Pad means
-            if mean.size < F.shape[0]:
-                mean = np.concatenate((mean, v))
-
-            means[i] = (F .dot (mean))[:self.means.shape[1]]
-
-        covariances = np.empty_like(self.covariances)
-        for i, covariance in enumerate(self.covariances):
-
-            # Pad covariances
-            if covariance.shape[0] < F.shape[0]:
-                covariance = block_diag(covariance, np.eye(2) * v_std)
-
-
-            covariance = F .dot (covariance) .dot (F.T) + \
-                Gamma .dot(Q) .dot (Gamma.T)
-
-            m = self.covariances.shape[1]
-            covariances[i] = covariance[:m,:m]
+        means = (means .dot (F.T))[:, :m]
+        covariances = np.einsum('ij,njk,lk->nil', F, covariances, F) + Q
+        covariances = covariances[:, :m, :m]
 
         self.update(means=means, covariances=covariances)
 
@@ -496,7 +614,123 @@ class GaussianMixture(Probability):
 
     #     return muOut, SigmaOut, wtOut #lkOut
 
-    def find_MAP(self, bounds=None, res=0.1):
+    def entropy(self, mode='grid'):
+        """Differential entropy of the mixture.
+
+        Modes follow Huber et al., "On Entropy Approximation for Gaussian
+        Mixture Random Vectors" (MFI 2008):
+
+        * 'grid': sum over the discretized pdf (see `Probability.entropy`)
+        * 'upper': upper bound from treating mixands as disjoint
+        * 'lower': lower bound from Jensen's inequality
+        * 'taylor': second-order Taylor expansion of log(pdf) about each mean
+        * 'sigma_point': log(pdf) averaged over each mixand's sigma points
+
+        All modes but 'grid' are independent of any discretization.
+        """
+        if mode == 'grid':
+            return super(GaussianMixture, self).entropy()
+
+        weights = self.weights
+        means, _, whitening, log_norm, _ = self._get_factors()
+        with np.errstate(divide='ignore'):
+            log_weights = np.log(weights)
+
+        if mode == 'upper':
+            H = weights .dot (-log_weights - log_norm + 0.5 * self.ndims)
+        elif mode == 'lower':
+            # Mixand overlaps N(mu_i; mu_j, P_i + P_j)
+            n, k = means.shape
+            pair_covariances = self.covariances[:, None] \
+                + self.covariances[None, :]
+            _, pair_whitening, pair_log_norm, _ = \
+                factorize_covariances(pair_covariances.reshape(-1, k, k))
+            diffs = (means[:, None] - means[None, :]).reshape(-1, k)
+            z = np.einsum('nij,nj->ni', pair_whitening, diffs)
+            log_overlaps = pair_log_norm - 0.5 * np.einsum('ni,ni->n', z, z)
+            overlaps = np.exp(log_overlaps.reshape(n, n))
+            H = -weights .dot (np.log(overlaps .dot (weights)))
+        elif mode == 'taylor':
+            # Gradient and Hessian of the pdf at every mean
+            precisions = np.einsum('nji,njk->nik', whitening, whitening)
+            diffs = means[:, None] - means[None, :]
+            z = np.einsum('jkl,ijl->ijk', precisions, diffs)
+            log_pdfs = log_norm + log_weights \
+                - 0.5 * np.einsum('ijk,ijk->ij', diffs, z)
+            pdfs = np.exp(log_pdfs)
+            g = pdfs.sum(axis=1)
+            grad = -np.einsum('ij,ijk->ik', pdfs, z)
+            hess = np.einsum('ij,ijk,ijl->ikl', pdfs, z, z) \
+                - np.einsum('ij,jkl->ikl', pdfs, precisions)
+
+            # Hessian of log(pdf), contracted with each covariance
+            log_hess = hess / g[:, None, None] \
+                - grad[:, :, None] * grad[:, None, :] / g[:, None, None] ** 2
+            H2 = np.einsum('ikl,ilk->i', log_hess, self.covariances)
+            H = -weights .dot (np.log(g) + 0.5 * H2)
+        elif mode == 'sigma_point':
+            points, point_weights = self.sigma_points()
+            log_pdfs = np.log(self.pdf(points))
+            H = -weights .dot (log_pdfs .dot (point_weights))
+        else:
+            logging.error('Unknown entropy mode {}.'.format(mode))
+            raise ValueError
+        return H
+
+    def sigma_points(self, kappa=None):
+        """Unscented-transform sigma points of every mixand.
+
+        Returns the points (mixands x 2 * ndims + 1 x ndims) and their
+        weights, shared by all mixands. `kappa` defaults to 3 - ndims.
+        """
+        n = self.ndims
+        if kappa is None:
+            kappa = 3 - n
+        means, sqrt_covariances, _, _, _ = self._get_factors()
+
+        offsets = np.sqrt(n + kappa) * np.swapaxes(sqrt_covariances, 1, 2)
+        points = np.concatenate((means[:, None, :],
+                                 means[:, None, :] + offsets,
+                                 means[:, None, :] - offsets), axis=1)
+        point_weights = np.empty(2 * n + 1)
+        point_weights[0] = kappa / (n + kappa)
+        point_weights[1:] = 1 / (2 * (n + kappa))
+        return points, point_weights
+
+    def gauss_hermite_points(self, order=3):
+        """Gauss-Hermite cubature points of every mixand.
+
+        Returns the tensor-product points (mixands x order ** ndims x ndims)
+        and their weights, shared by all mixands. The rule is exact for
+        polynomials of degree up to 2 * order - 1 in each dimension.
+        """
+        n = self.ndims
+        nodes, node_weights = np.polynomial.hermite.hermgauss(order)
+        nodes = np.sqrt(2) * nodes
+        node_weights = node_weights / np.sqrt(np.pi)
+
+        grid = np.array(list(itertools.product(nodes, repeat=n)))
+        point_weights = np.prod(list(itertools.product(node_weights,
+                                                       repeat=n)), axis=1)
+
+        means, sqrt_covariances, _, _, _ = self._get_factors()
+        points = means[:, None, :] \
+            + np.einsum('kij,pj->kpi', sqrt_covariances, grid)
+        return points, point_weights
+
+    def find_MAP(self, bounds=None, res=0.1, feasible_region=None,
+                 use_grid=False):
+        """Find the maximum a posteriori point over the first two dimensions.
+
+        By default, the MAP is the highest mode found by `find_modes`,
+        optionally constrained to `feasible_region`. `use_grid` falls back
+        to the argmax over a grid with the given bounds and resolution.
+        """
+        if not use_grid:
+            modes, mode_probs, _ = self.find_modes(feasible_region=
+                                                   feasible_region)
+            return modes[0], mode_probs[0]
+
         #<>TODO: set for n-dimensional
         if not hasattr(self, 'pos'):
             self._discretize(bounds, res)
@@ -512,6 +746,87 @@ class GaussianMixture(Probability):
         MAP_prob = prob[MAP_i]
         return MAP_point, MAP_prob
 
+    def find_modes(self, feasible_region=None, max_iterations=100,
+                   tol=1E-6, mode_tol=1E-3):
+        """Find the modes of the mixture's first two dimensions.
+
+        Runs fixed-point mean-shift iterations (Carreira-Perpinan, "Mode-
+        finding for mixtures of Gaussian distributions", 2000) from every
+        mixand mean at once. Starts converging to within `mode_tol` of each
+        other share a mode.
+
+        Parameters
+        ----------
+        feasible_region : shapely Polygon, optional
+            Discard modes outside this region (unless all are outside).
+        max_iterations : int, optional
+            Maximum number of mean-shift iterations.
+        tol : float, optional
+            Largest step at which all starts are considered converged.
+        mode_tol : float, optional
+            Distance within which converged starts are one mode.
+
+        Returns
+        -------
+        tuple
+            Modes, their pdf values and their masses (the total weight of
+            the mixands converging to each mode), by decreasing pdf value.
+        """
+        if self.ndims > 2:
+            gm = self.marginal([0, 1])
+        else:
+            gm = self
+        means, _, whitening, log_norm, _ = gm._get_factors()
+        precisions = np.einsum('nji,njk->nik', whitening, whitening)
+        precision_means = np.einsum('nij,nj->ni', precisions, means)
+        with np.errstate(divide='ignore'):
+            log_weights = np.log(gm.weights) + log_norm
+
+        # x <- (sum_j p(j|x) P_j)^-1 sum_j p(j|x) P_j mu_j
+        x = means.copy()
+        for _ in range(max_iterations):
+            diffs = x[:, None, :] - means[None, :, :]
+            z = np.einsum('jkl,ijl->ijk', whitening, diffs)
+            log_r = log_weights - 0.5 * np.einsum('ijk,ijk->ij', z, z)
+            r = np.exp(log_r - log_r.max(axis=1)[:, None])
+            r /= r.sum(axis=1)[:, None]
+
+            A = np.einsum('ij,jkl->ikl', r, precisions)
+            b = r .dot (precision_means)
+            new_x = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+            step = np.abs(new_x - x).max()
+            x = new_x
+            if step < tol:
+                break
+
+        # Group converged starts into modes
+        modes = []
+        mode_masses = []
+        for start, weight in zip(x, gm.weights):
+            for i, mode in enumerate(modes):
+                if np.linalg.norm(start - mode) < mode_tol:
+                    mode_masses[i] += weight
+                    break
+            else:
+                modes.append(start)
+                mode_masses.append(weight)
+        modes = np.array(modes)
+        mode_masses = np.array(mode_masses)
+        mode_probs = gm.pdf(modes)
+
+        if feasible_region is not None:
+            feasible = np.array([feasible_region.contains(Point(mode))
+                                 for mode in modes])
+            if feasible.any():
+                modes = modes[feasible]
+                mode_probs = mode_probs[feasible]
+                mode_masses = mode_masses[feasible]
+            else:
+                logging.warn('No mode lies in the feasible region.')
+
+        order = np.argsort(-mode_probs)
+        return modes[order], mode_probs[order], mode_masses[order]
+
     def std_ellipses(self, num_std=1, resolution=20):
         """
         Generates `num_std` sigma error ellipses for each mixand.
@@ -651,14 +966,14 @@ class GaussianMixture(Probability):
         # gm = GaussianMixture(beta_hat, mu_hat, var_hat, bounds=bounds, pos=pos, pos_all=pos_all)
         # return gm
 
-    def _input_check(self):
+    def _input_check(self, merge=True):
         # Check if weights are normalized
         try:
             new_weights = self.weights / np.sum(self.weights)
             assert np.array_equal(self.weights, new_weights)
         except AssertionError, e:
             self.weights = new_weights
-            logging.debug("Weights renormalized to {}".format(self.weights))
+            logging.debug("Weights renormalized to %s", self.weights)
 
         # Check if weights sum to 1
         try:
@@ -687,7 +1002,8 @@ class GaussianMixture(Probability):
             logging.exception('Means and weights don\'t agree.')
             raise e
 
-        # Properly format covariances
+        # Properly format covariances (which also makes them correspond to
+        # the means' dimensions)
         try:
             self.covariances = self.covariances.reshape(self.weights.size,
                                                         self.ndims, self.ndims)
@@ -695,30 +1011,21 @@ class GaussianMixture(Probability):
             logging.exception('Covariances and weights don\'t agree.')
             raise e
 
-        # Check if means correspond to variance dimensions
-        for i, mean in enumerate(self.means):
-            var = self.covariances[i]
-            try:
-                assert mean.size == var.shape[0]
-                assert mean.size == var.shape[1]
-            except AssertionError, e:
-                logging.exception('Mean {} doesn\'t correspond to variance:'
-                                  ' \n{}'.format(mean, var))
-                raise e
-
         # Check if covariances are symmetric
-        for var in self.covariances:
-            try:
-                tol = 10 ** -6
-                a = np.ones_like(var) * tol
-                assert np.less(var.T - var, a).all()
-            except AssertionError, e:
-                logging.exception('Following variance is not symmetric: \n{} '
-                                  .format(var))
-                raise e
+        tol = 10 ** -6
+        asymmetric = np.swapaxes(self.covariances, 1, 2) - self.covariances
+        asymmetric = ~np.less(asymmetric, tol).all(axis=(1, 2))
+        try:
+            assert not asymmetric.any()
+        except AssertionError, e:
+            var = self.covariances[asymmetric.argmax()]
+            logging.exception('Following variance is not symmetric: \n{} '
+                              .format(var))
+            raise e
 
         # Merge if necessary
-        self._merge()
+        if merge:
+            self._merge()
 
     def _discretize(self, bounds=None, res=0.1, all_dims=False):
         
@@ -737,40 +1044,21 @@ class GaussianMixture(Probability):
             self.pos = x
             self.pos_all = x
         elif self.ndims == 2:
-            xx, yy = np.mgrid[self.bounds[0]:self.bounds[2]:res,
-                              self.bounds[1]:self.bounds[3]:res]
-            pos = np.empty(xx.shape + (2,))
-            pos[:, :, 0] = xx; pos[:, :, 1] = yy
-            self.X = xx; self.Y = yy
-            self.pos = pos
-            self.pos_all = pos
+            self.X, self.Y, self.pos = shared_grid(self.bounds, res)
+            self.pos_all = self.pos
 
         elif self.ndims > 2:
 
             logging.debug('Using first two variables as x and y')
-            xx, yy = np.mgrid[self.bounds[0]:self.bounds[2]:res,
-                              self.bounds[1]:self.bounds[3]:res]
-            pos = np.empty(xx.shape + (2,))
-            pos[:, :, 0] = xx; pos[:, :, 1] = yy
-            self.X = xx; self.Y = yy
-            self.pos = pos
-
+            self.X, self.Y, self.pos = shared_grid(self.bounds[:4], res)
 
             if all_dims:
                 #<>TODO: use more than the ndims == 4 case
                 full_bounds = self.bounds[0:2] + [-0.5, -0.5] \
                     + self.bounds[2:] + [0.5, 0.5]
                 v_spacing = 0.1
-                grid = np.mgrid[full_bounds[0]:full_bounds[4]:res,
-                                full_bounds[1]:full_bounds[5]:res,
-                                full_bounds[2]:full_bounds[6]:v_spacing,
-                                full_bounds[3]:full_bounds[7]:v_spacing,
-                                ]
-                pos = np.empty(grid[0].shape + (4,))
-                pos[:, :, :, :, 0] = grid[0]
-                pos[:, :, :, :, 1] = grid[1]
-                pos[:, :, :, :, 2] = grid[2]
-                pos[:, :, :, :, 3] = grid[3]
+                pos = shared_grid(full_bounds,
+                                  [res, res, v_spacing, v_spacing])[-1]
 
                 self.pos_all = pos
         else:
@@ -792,65 +1080,165 @@ class GaussianMixture(Probability):
             logging.debug('Merging {} mixands down to {}.'
                           .format(self.num_mixands, self.max_num_mixands))
 
-        # Create lower-triangle of dissimilarity matrix B
-        #<>TODO: this is O(n ** 2) and very slow. Speed it up! parallelize?
-        B = np.zeros((self.num_mixands, self.num_mixands))
-        for i in range(self.num_mixands):
-            mix_i = (self.weights[i], self.means[i], self.covariances[i])
-            for j in range(i):
-                if i == j:
-                    continue
-                mix_j = (self.weights[j], self.means[j], self.covariances[j])
-                B[i,j] = mixand_dissimilarity(mix_i, mix_j)
+        # Parameter arrays may be shared with copies, so don't merge in place
+        self._weights = self.weights.copy()
+        self._means = self.means.copy()
+        self._covariances = self.covariances.copy()
+
+        # Find dissimilarities of all pairs (i > j) at once, and keep them
+        # in a heap. Entries are invalidated lazily through mixand versions.
+        logdets = _safe_logdets(self.covariances)
+        i, j = np.tril_indices(self.num_mixands, -1)
+        B = mixand_dissimilarities(self.weights, self.means, self.covariances,
+                                   i, j, logdets)
+        heap = list(zip(B, i, j, np.zeros_like(i), np.zeros_like(j)))
+        heapq.heapify(heap)
+        versions = np.zeros(self.num_mixands, dtype=np.int)
+        alive = np.ones(self.num_mixands, dtype=np.bool)
 
         # Keep merging until we get the right number of mixands
         deleted_mixands = []
         while self.num_mixands > max_num_mixands:
             # Find most similar mixands
             try:
-                #<>TODO: replace with infinities, not 0
-                min_B = B[B>0].min()
-            except ValueError, e:
-                logging.error('Could not find a minimum value in B: \n{}'
-                              .format(B))
+                _, i, j, v_i, v_j = heapq.heappop(heap)
+            except IndexError, e:
+                logging.error('Could not find a pair of mixands to merge.')
                 raise e
-            ind = np.where(B==min_B)
-            i, j = ind[0][0], ind[1][0]
+            if not (alive[i] and alive[j]
+                    and versions[i] == v_i and versions[j] == v_j):
+                continue
 
             # Get merged mixand
             mix_i = (self.weights[i], self.means[i], self.covariances[i])
             mix_j = (self.weights[j], self.means[j], self.covariances[j])
             w_ij, mu_ij, P_ij = merge_mixands(mix_i, mix_j)
 
-            # Replace mixand i with merged mixand
+            # Replace mixand i with merged mixand, and remove mixand j
             ij = i
             self.weights[ij] = w_ij
             self.means[ij] = mu_ij
             self.covariances[ij] = P_ij
-
-            # Fill mixand i's B values with new mixand's B values
-            mix_ij = (w_ij, mu_ij, P_ij)
+            logdets[ij] = _safe_logdets(P_ij[None])[0]
+            versions[ij] += 1
+            alive[j] = False
             deleted_mixands.append(j)
-            for k in range(B.shape[0]):
-                if k == ij or k in deleted_mixands:
-                    continue
-
-                # Only fill lower triangle
-                mix_k = (self.weights[k], self.means[k], self.covariances[k])
-                if k < i:
-                    B[ij,k] = mixand_dissimilarity(mix_k, mix_ij)
-                else:
-                    B[k,ij] = mixand_dissimilarity(mix_k, mix_ij)
-
-            # Remove mixand j from B
-            B[j,:] = np.inf
-            B[:,j] = np.inf
             self.num_mixands -= 1
 
+            # Only refresh the pairs touching the merged mixand
+            k = np.flatnonzero(alive)
+            k = k[k != ij]
+            if k.size == 0:
+                continue
+            B = mixand_dissimilarities(self.weights, self.means,
+                                       self.covariances, k, ij, logdets)
+            for b, k_ in zip(B, k):
+                if k_ < ij:
+                    entry = (b, ij, k_, versions[ij], versions[k_])
+                else:
+                    entry = (b, k_, ij, versions[k_], versions[ij])
+                heapq.heappush(heap, entry)
+
         # Delete removed mixands from parameter arrays
         self._weights = np.delete(self.weights, deleted_mixands, axis=0)
         self._means = np.delete(self.means, deleted_mixands, axis=0)
         self._covariances = np.delete(self.covariances, deleted_mixands, axis=0)
+        self._factor_cache = {}
+
+
+_constant_velocity_models = {}
+
+
+def constant_velocity_model(n_steps=1, dt=0.1, q=1.5):
+    """Return the n-step transition matrix and process noise of the 2D
+    constant-velocity model, caching them for reuse.
+
+    The n-step model is F^n with accumulated process noise
+    sum_{i<n} F^i Gamma Q Gamma^T F^i^T for a state [x, y, v_x, v_y].
+    """
+    key = (n_steps, dt, q)
+    try:
+        return _constant_velocity_models[key]
+    except KeyError:
+        pass
+
+    F = np.array([[1, 0, dt, 0],
+                  [0, 1, 0, dt],
+                  [0, 0, 1, 0],
+                  [0, 0, 0, 1]])
+    Gamma = np.array([[0.5*dt**2, 0],
+                      [0, 0.5*dt**2],
+                      [dt, 0],
+                      [0, dt]])
+    Q = Gamma .dot (np.eye(2) * q) .dot (Gamma.T)
+
+    F_k = np.eye(4)
+    Q_k = np.zeros((4, 4))
+    for _ in range(n_steps):
+        Q_k += F_k .dot (Q) .dot (F_k.T)
+        F_k = F .dot (F_k)
+
+    _constant_velocity_models[key] = (F_k, Q_k)
+    return F_k, Q_k
+
+
+def factorize_covariances(covariances):
+    """Factorize a stack of covariance matrices in one pass.
+
+    Returns square roots `L` (with L L^T = P), whitening matrices `W` (with
+    W^T W = P^+) and log normalization constants for each covariance. A
+    batched Cholesky decomposition is used when all covariances are
+    positive definite; otherwise, eigendecompositions allow for singular
+    covariances in the same way as `multivariate_normal(allow_singular=True)`,
+    and the null space of each covariance (with its tolerance) is returned
+    as the last element instead of None.
+    """
+    covariances = np.asarray(covariances, dtype=np.float)
+    ndims = covariances.shape[-1]
+
+    try:
+        chol = np.linalg.cholesky(covariances)
+        eye = np.broadcast_to(np.eye(ndims), covariances.shape)
+        whitening = np.linalg.solve(chol, eye)
+        log_pdet = 2 * np.log(np.diagonal(chol, axis1=1, axis2=2)).sum(axis=1)
+        rank = ndims
+        null_space = None
+    except np.linalg.LinAlgError:
+        s, u = np.linalg.eigh(covariances)
+        eps = 1E6 * np.finfo(np.float).eps * np.abs(s).max(axis=1)
+        nonzero = s > eps[:, None]
+        s_safe = np.where(nonzero, s, 1)
+        chol = u * np.sqrt(np.where(nonzero, s, 0))[:, None, :]
+        whitening = np.swapaxes(u / np.sqrt(s_safe)[:, None, :], 1, 2)
+        whitening = whitening * nonzero[:, :, None]
+        log_pdet = np.log(s_safe).sum(axis=1)
+        rank = nonzero.sum(axis=1)
+        null_space = (u * ~nonzero[:, None, :], eps[:, None])
+
+    log_norm = -0.5 * (rank * np.log(2 * np.pi) + log_pdet)
+    return chol, whitening, log_norm, null_space
+
+
+def quadratic_features(x):
+    """Features [x_i * x_j (i <= j), x_i, 1] of each row of x.
+
+    Paired with `quadratic_coefficients`, lets a stack of quadratic forms be
+    evaluated over many points with a single matrix product.
+    """
+    x = np.asarray(x, dtype=np.float)
+    i, j = np.triu_indices(x.shape[1])
+    return np.hstack((x[:, i] * x[:, j], x, np.ones((x.shape[0], 1))))
+
+
+def quadratic_coefficients(precisions, means):
+    """Coefficients of (x - mu)^T A (x - mu) over `quadratic_features`.
+    """
+    i, j = np.triu_indices(means.shape[1])
+    quadratic = precisions[:, i, j] * np.where(i == j, 1, 2)
+    precision_means = np.einsum('nij,nj->ni', precisions, means)
+    linear = -2 * precision_means
+    constant = np.einsum('ni,ni->n', means, precision_means)
+    return np.hstack((quadratic, linear, constant[:, None]))
 
 
 def entr(p_i):
@@ -909,6 +1297,44 @@ def mixand_dissimilarity(mix_i, mix_j):
     return b
 
 
+def mixand_dissimilarities(weights, means, covariances, i, j, logdets=None):
+    """Vectorized `mixand_dissimilarity` between mixands i[k] and j[k].
+
+    Parameters
+    ----------
+    weights, means, covariances : array_like
+        Stacked mixand parameters.
+    i, j : array_like
+        Indices of the mixand pairs to compare (either may be a scalar).
+    logdets : array_like, optional
+        Precomputed log-determinants of `covariances`, as given by
+        `_safe_logdets`.
+    """
+    if logdets is None:
+        logdets = _safe_logdets(covariances)
+    i, j = np.broadcast_arrays(i, j)
+    w_i, w_j = weights[i], weights[j]
+    w_ij = w_i + w_j
+    w_i_ij = (w_i / w_ij)[:, None, None]
+    w_j_ij = (w_j / w_ij)[:, None, None]
+
+    # Covariances of the moment-preserving merges
+    d = means[i] - means[j]
+    P_ij = w_i_ij * covariances[i] + w_j_ij * covariances[j] \
+        + w_i_ij * w_j_ij * d[:, :, None] * d[:, None, :]
+
+    return 0.5 * (w_ij * _safe_logdets(P_ij)
+                  - w_i * logdets[i] - w_j * logdets[j])
+
+
+def _safe_logdets(covariances):
+    """Log-determinants of stacked covariances, with 0 for singular ones.
+    """
+    _, logdets = np.linalg.slogdet(covariances)
+    logdets[np.isinf(logdets)] = 0
+    return logdets
+
+
 def generate_random_params(num_mixands, ndims=2, spread=4):
     # Randomly generate parameters
     weights = np.random.uniform(size=num_mixands)
@@ -21,7 +21,8 @@ from scipy.stats import multivariate_normal
 from scipy.sparse import csr_matrix
 from shapely.geometry import Point
 
-from cops_and_robots.fusion.probability import Probability
+from cops_and_robots.fusion.probability import (Probability, shared_grid,
+                                                shared_states)
 from cops_and_robots.fusion.gaussian_mixture import fleming_prior
 
 
@@ -182,28 +183,18 @@ class Grid(Probability):
         elif self.ndims >= 2:
 
             logging.debug('Using first two variables as x and y')
-            X, Y = np.mgrid[self.bounds[0]:self.bounds[2] + self.res:self.res,
-                            self.bounds[1]:self.bounds[3] + self.res:self.res]
-            pos = np.empty(X.shape + (2,))
+            X, Y, _ = shared_grid(self.bounds[:4], self.res, inclusive=True)
             self.X = X; self.Y = Y
-            pos = np.dstack((self.X, self.Y))
-            self.pos = np.reshape(pos, (self.X.size, 2))
+            self.pos = shared_states(self.bounds[:4], self.res, inclusive=True)
 
             if all_dims:
                 #<>TODO: use more than the ndims == 4 case
                 full_bounds = self.bounds[0:2] + [-0.5, -0.5] \
                     + self.bounds[2:] + [0.5, 0.5]
                 v_spacing = 0.1
-                grid = np.mgrid[full_bounds[0]:full_bounds[4] + res:res,
-                                full_bounds[1]:full_bounds[5] + res:res,
-                                full_bounds[2]:full_bounds[6] + v_spacing:v_spacing,
-                                full_bounds[3]:full_bounds[7] + v_spacing:v_spacing,
-                                ]
-                pos = np.empty(grid[0].shape + (4,))
-                pos[:, :, :, :, 0] = grid[0]
-                pos[:, :, :, :, 1] = grid[1]
-                pos[:, :, :, :, 2] = grid[2]
-                pos[:, :, :, :, 3] = grid[3]
+                pos = shared_grid(full_bounds,
+                                  [self.res, self.res, v_spacing, v_spacing],
+                                  inclusive=True)[-1]
 
                 self.pos_all = pos
         else:
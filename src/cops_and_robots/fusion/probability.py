@@ -12,7 +12,7 @@ __email__ = "nick.sweet@colorado.edu"
 __status__ = "Development"
 
 import logging
-from copy import deepcopy
+from copy import copy, deepcopy
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -32,6 +32,12 @@ class Probability(object):
 
     """
 
+    # Plotting state that isn't shared with copies
+    _uncopied_attrs = ('fig', 'ax', 'contourf', 'cbar', 'ellipse_patches')
+
+    # Arrays that are routinely modified in place, and so are never shared
+    _mutable_attrs = ('prob', '_prob')
+
     def __init__(self, bounds, res):
         self.bounds = bounds
         self.ndims = int(len(bounds) / 2)
@@ -205,5 +211,119 @@ class Probability(object):
         self.plot_remove()
         self.plot(**kwargs)
 
-    def copy(self):
-        return deepcopy(self)
\ No newline at end of file
+    def copy(self, deep=False):
+        """Return a copy of this probability.
+
+        By default, the copy shares its numpy arrays (parameters and grids)
+        with the original, and only duplicates containers such as lists and
+        dicts, along with the discretized `prob`, which callers commonly
+        update in place. Shared arrays are treated as immutable: they are
+        replaced rather than written to, so neither object sees the other's
+        updates. Plotting state is not carried over.
+
+        Use `deep=True` for a fully independent deep copy.
+        """
+        if deep:
+            return deepcopy(self)
+
+        new = self.__class__.__new__(self.__class__)
+        for name, value in self.__dict__.iteritems():
+            if name in self._uncopied_attrs:
+                continue
+            if isinstance(value, (list, dict, set)):
+                value = copy(value)
+            elif name in self._mutable_attrs and isinstance(value, np.ndarray):
+                value = value.copy()
+            new.__dict__[name] = value
+        return new
+
+
+_shared_grids = {}
+_shared_grid_arrays = {}  # By id, to recognize shared grids
+
+
+def shared_grid(bounds, res, inclusive=False):
+    """Return a read-only, process-wide grid over the given bounds.
+
+    Grids are built with `np.mgrid` once per (bounds, res, inclusive) and
+    shared by every Probability (and Softmax) object that asks for them, so
+    they must never be written to.
+
+    Parameters
+    ----------
+    bounds : array_like
+        Flattened bounds, with all minimums followed by all maximums (e.g.
+        [x_min, y_min, x_max, y_max]).
+    res : float or array_like
+        Grid spacing, either for all dimensions or for each one.
+    inclusive : bool, optional
+        Whether to include the upper bounds in the grid. Default is False.
+
+    Returns
+    -------
+    tuple
+        One coordinate array per dimension, followed by the stacked
+        positions (with the dimension as the last axis).
+    """
+    bounds = tuple(float(b) for b in bounds)
+    ndims = len(bounds) // 2
+    res = tuple(float(r) for r in np.broadcast_to(res, (ndims,)))
+    key = (bounds, res, inclusive)
+
+    try:
+        return _shared_grids[key]
+    except KeyError:
+        pass
+
+    slices = []
+    for lower, upper, r in zip(bounds[:ndims], bounds[ndims:], res):
+        if inclusive:
+            upper += r
+        slices.append(slice(lower, upper, r))
+    coords = np.mgrid[tuple(slices)]
+    pos = np.empty(coords[0].shape + (ndims,))
+    for i, coord in enumerate(coords):
+        pos[..., i] = coord
+
+    grid = tuple(coords) + (pos,)
+    for array in grid:
+        _register_shared_array(array)
+    _shared_grids[key] = grid
+    return grid
+
+
+def shared_states(bounds, res, inclusive=False):
+    """Return the positions of `shared_grid` as one (N x ndims) array.
+
+    Like the grid itself, the array is read-only and shared by everything
+    asking for the same bounds and resolution.
+    """
+    pos = shared_grid(bounds, res, inclusive)[-1]
+    key = ('states', id(pos))
+    try:
+        return _shared_grids[key]
+    except KeyError:
+        pass
+
+    states = np.reshape(pos, (-1, pos.shape[-1]))
+    _register_shared_array(states)
+    _shared_grids[key] = states
+    return states
+
+
+def is_shared_grid(array):
+    """Whether `array` was created by `shared_grid` or `shared_states`.
+    """
+    return _shared_grid_arrays.get(id(array)) is array
+
+
+def _register_shared_array(array):
+    array.flags.writeable = False
+    _shared_grid_arrays[id(array)] = array
+
+
+def clear_shared_grids():
+    """Release all grids created by `shared_grid`.
+    """
+    _shared_grids.clear()
+    _shared_grid_arrays.clear()
@@ -1,9 +1,10 @@
 __all__ = ['_models', '_synthesis', '_visualization', 'softmax', 
-           'softmax_class', 'binary_softmax', ]
+           'softmax_class', 'binary_softmax', 'product_softmax', ]
 
 from cops_and_robots.fusion.softmax.softmax import Softmax
 from cops_and_robots.fusion.softmax.binary_softmax import BinarySoftmax
 from cops_and_robots.fusion.softmax.softmax_class import SoftmaxClass
+from cops_and_robots.fusion.softmax.product_softmax import ProductSoftmax
 
 from cops_and_robots.fusion.softmax._models import (binary_intrinsic_space_model,
                                                     intrinsic_space_model,
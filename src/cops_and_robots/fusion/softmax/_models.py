@@ -1,5 +1,8 @@
 from __future__ import division
+import os
 import logging
+import hashlib
+import zipfile
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -7,6 +10,18 @@ from shapely.geometry import box, Polygon
 from shapely.affinity import scale
 
 from cops_and_robots.fusion.softmax import Softmax, SoftmaxClass, BinarySoftmax
+from cops_and_robots.fusion.softmax.softmax import normals_from_polygon
+
+# Categorical relation models, stored by a digest of everything they're
+# built from in the user's cache directory (or COPS_AND_ROBOTS_MODEL_CACHE).
+# Bump the version whenever the models themselves change.
+model_cache_dir = os.environ.get(
+    'COPS_AND_ROBOTS_MODEL_CACHE',
+    os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                os.path.expanduser('~/.cache')),
+                 'cops_and_robots', 'relation_models'))
+_model_cache = {}
+_model_cache_version = 2
 
 
 def _make_regular_2D_poly(n_sides=3, origin=(0, 0), theta=0, max_r=1):
@@ -137,16 +152,17 @@ def pentagon_model():
     return sm
 
 
-def range_model(poly=None, spread=1, bounds=None):
+def range_model(poly=None, spread=1, bounds=None, near_steepness=10,
+                outside_steepness=11):
     if poly == None:
         poly = _make_regular_2D_poly(4, max_r=2, theta=np.pi/4)
     num_classes = len(poly.exterior.coords)
     labels = ['Inside'] + ['Near'] * (num_classes - 1)
-    steepnesses = [10] * num_classes
+    steepnesses = [near_steepness] * num_classes
     sm = Softmax(poly=poly, labels=labels, resolution=0.1,
                  steepness=steepnesses, bounds=bounds)
 
-    steepnesses = [11] * num_classes
+    steepnesses = [outside_steepness] * num_classes
     # far_bounds = _make_regular_2D_poly(4, max_r=3, theta=np.pi/4)
     larger_poly = scale(poly, 2, 2)
     labels = ['Inside'] + ['Outside'] * (num_classes - 1)
@@ -162,15 +178,20 @@ def range_model(poly=None, spread=1, bounds=None):
     return sm
 
 
-def binary_range_model(poly=None, bounds=None, container_poly=None):
+def binary_range_model(poly=None, bounds=None, container_poly=None,
+                       cache=True):
     #<>TODO: implement constraints using container_poly
 
-    dsm = range_model(poly, bounds=bounds)
+    params = dict(spread=1, near_steepness=10, outside_steepness=11)
+    dsm = _cached_model(lambda: range_model(poly, bounds=bounds, **params),
+                        ['range_model', _coords(poly), _coords(bounds),
+                         sorted(params.items())],
+                        bounds=bounds, cache=cache)
     bdsm = BinarySoftmax(dsm, bounds=bounds)
     return bdsm
 
 
-def intrinsic_space_model(poly=None, bounds=None):
+def intrinsic_space_model(poly=None, bounds=None, steepness=3):
     if poly == None:
         poly = _make_regular_2D_poly(4, max_r=2, theta=np.pi/4)
 
@@ -178,28 +199,38 @@ def intrinsic_space_model(poly=None, bounds=None):
     # <>TODO: If sides != 4, find a way to make it work!
     # NOTE: front and back are intrinsic, left and right are extrinsic
     labels = ['Inside', 'Front', 'Right', 'Back', 'Left']
-    steepness = 3
     sm = Softmax(poly=poly, labels=labels, resolution=0.1,
                  steepness=steepness, bounds=bounds)
     return sm
 
 
 def binary_intrinsic_space_model(poly=None, bounds=None, allowed_relations=None, 
-                                 container_poly=None):
+                                 container_poly=None, cache=True):
     if bounds is None:
         bounds = [-5, -5, 5, 5]
-    ism = intrinsic_space_model(poly, bounds=bounds)
 
-    if container_poly is not None:
-        n, o = normals_from_polygon(container_poly)
+    params = dict(steepness=3, outside_steepness=10)
+
+    def build():
+        ism = intrinsic_space_model(poly, bounds=bounds,
+                                    steepness=params['steepness'])
+
+        if container_poly is not None:
+            n, o = normals_from_polygon(container_poly)
 
-        steepness = 10
-        outside_weights = n * steepness + ism.weights[1:] 
-        outside_biases = o * steepness + ism.biases[1:] 
+            steepness = params['outside_steepness']
+            outside_weights = n * steepness + ism.weights[1:] 
+            outside_biases = o * steepness + ism.biases[1:] 
 
-        labels = ['Outside'] * 4
-        # labels = ['Outside_Front','Outside_Left','Outside_Back','Outside_Right']
-        ism.add_classes(outside_weights, outside_biases, labels)
+            labels = ['Outside'] * 4
+            # labels = ['Outside_Front','Outside_Left','Outside_Back','Outside_Right']
+            ism.add_classes(outside_weights, outside_biases, labels)
+        return ism
+
+    ism = _cached_model(build, ['intrinsic_space_model', _coords(poly),
+                                _coords(bounds), _coords(container_poly),
+                                sorted(params.items())],
+                        bounds=bounds, cache=cache)
 
     
     # <>TODO: remove this debug stub
@@ -213,6 +244,100 @@ def binary_intrinsic_space_model(poly=None, bounds=None, allowed_relations=None,
     return bism
 
 
+def _coords(shape):
+    """Rounded coordinates of a polygon (or bounds), for model cache keys.
+    """
+    if shape is None:
+        return None
+    if isinstance(shape, Polygon):
+        shape = shape.exterior.coords
+    return [[round(float(c), 9) for c in np.ravel(pt)] for pt in shape]
+
+
+def _cached_model(build, key_parts, bounds=None, cache=True):
+    """Build a categorical softmax model, or reload an identical one.
+
+    Models are stored as the weights, biases, labels, polygon, resolution
+    and steepness of `build()`'s model in one .npz file per digest of
+    `key_parts` under `model_cache_dir`, and kept in memory once loaded.
+    Missing, corrupt or truncated files are rebuilt. The returned model is
+    always rebuilt from the stored values, so it's the same whether or not
+    the cache was hit.
+
+    Parameters
+    ----------
+    build : callable
+        Creates the model when it isn't cached.
+    key_parts : list
+        Everything the model is built from: a model name, polygon
+        coordinates, bounds and parameters.
+    bounds : array_like, optional
+        Bounds given to the reloaded model.
+    cache : bool, optional
+        Whether to use the cache at all. Default is `True`.
+
+    """
+    if not cache:
+        return build()
+
+    key = hashlib.sha1(repr([_model_cache_version] + key_parts)).hexdigest()
+    filename = os.path.join(model_cache_dir, key + '.npz')
+    if key not in _model_cache:
+        try:
+            with np.load(filename) as data:
+                _model_cache[key] = dict(
+                    weights=data['weights'], biases=data['biases'],
+                    labels=[str(l) for l in data['labels']],
+                    poly=data['poly'], resolution=float(data['resolution']),
+                    steepness=data['steepness'])
+            logging.debug('Loaded relation model {}.'.format(filename))
+        except (IOError, KeyError, ValueError, zipfile.BadZipfile):
+            sm = build()
+            if hasattr(sm, 'subclasses'):
+                labels = sm.subclass_labels
+            else:
+                labels = sm.class_labels
+            poly = sm.poly
+            if poly is None:
+                poly = np.zeros((0, 2))
+            else:
+                poly = np.array(poly.exterior.coords)
+            _model_cache[key] = dict(
+                weights=np.copy(sm.weights), biases=np.copy(sm.biases),
+                labels=list(labels), poly=poly,
+                resolution=float(sm.resolution),
+                steepness=np.array(sm.steepness, dtype=float))
+            _save_model(filename, _model_cache[key])
+
+    model = _model_cache[key]
+    sm = Softmax(weights=np.copy(model['weights']),
+                 biases=np.copy(model['biases']), labels=model['labels'],
+                 resolution=model['resolution'], bounds=bounds)
+    # The stored weights already include the steepness
+    sm.steepness = np.copy(model['steepness'])
+    if len(model['poly']) > 0:
+        sm.poly = Polygon(model['poly'])
+    return sm
+
+
+def _save_model(filename, model):
+    """Write a cached model, without ever leaving a partial file behind.
+    """
+    try:
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        tmp_filename = '{}.{}.npz'.format(filename[:-4], os.getpid())
+        np.savez(tmp_filename, weights=model['weights'],
+                 biases=model['biases'], labels=np.array(model['labels']),
+                 poly=model['poly'], resolution=model['resolution'],
+                 steepness=model['steepness'])
+        os.rename(tmp_filename, filename)
+        logging.debug('Saved relation model {}.'.format(filename))
+    except (IOError, OSError), e:
+        logging.warn('Couldn\'t save relation model {}: {}'
+                     .format(filename, e))
+
+
 def demo_models():
     logging.info('Preparing Softmax models for demo...')
     # Regular Softmax models #################################################
@@ -14,66 +14,46 @@ import time
 
 def product_model(models):
     """Generate a product model from multiple softmax models.
-    """
-    from softmax import Softmax
-
-    n = len(models)  # number of measurements
 
-    # Figure out how many terms are needed in denominator
-    M = 1  # total number of terms
-    for sm in models:
-        if sm.has_subclasses:
-            M *= sm.num_subclasses
-        else:
-            M *= sm.num_classes
-
-    # Generate lists of all parameters
-    #<>TODO: keep this a numpy-only operation, as per:
-    # http://stackoverflow.com/questions/1208118/using-numpy-to-build-an-array-of-all-combinations-of-two-arrays
-    model_weights = []
-    model_biases = []
-    model_labels = []
-    for i, sm in enumerate(models):
-        model_weights.append(sm.weights.tolist())
-        model_biases.append(sm.biases.tolist())
-        if sm.has_subclasses:
-            # Use class labels of each subclass
-            class_labels = []
-            for label in sm.subclass_labels:
-                i = label.find('__')
-                if i != -1:
-                    label = label[:i]
-                class_labels.append(label)
-            model_labels.append(class_labels)
-        else:
-            model_labels.append(sm.class_labels)
-
-    # Get all possible combinations of parameters
-    weight_combs = list(itertools.product(*model_weights))
-    bias_combs = list(itertools.product(*model_biases))
-    label_combs = list(itertools.product(*model_labels))
-
-    # Evaluate all combinations of model parameters 
-    product_weights = np.empty((M, models[0].weights.shape[1]))
-    product_biases = np.empty(M)
-    product_labels = []
-    for i, _ in enumerate(bias_combs):
-        product_weights[i] = np.array(weight_combs[i]).sum(axis=0)
-        product_biases[i] = np.array(bias_combs[i]).sum()
-        str_ = " + ".join(label_combs[i])
-        product_labels.append(str_)
-
-    sm = Softmax(weights=product_weights,
-                 biases=product_biases,
-                 labels=product_labels,
-                 )
-
-    return sm
+    The product is factored (see `ProductSoftmax`), so its terms are never
+    enumerated unless its full weights and biases are asked for.
+    """
+    from product_softmax import ProductSoftmax
+    return ProductSoftmax(models)
 
 # GEOMETRIC MODEL #############################################################
 
-def find_redundant_constraints(G_full, h_full, break_index=-1, verbose=False):
-    """Determine which constraints effect the feasible region."""
+def find_redundant_constraints(G_full, h_full, break_index=-1, verbose=False,
+                               tol=1E-6):
+    """Determine which constraints effect the feasible region.
+
+    Constraint i is redundant when the maximum of G_i.x subject to all
+    other constraints is at most h_i (within `tol`, relative to h_i), so
+    constraints that only touch the region, and every copy of a repeated
+    constraint, count as redundant. Two-dimensional constraints are all
+    checked through the convex hull of their duals (see
+    `_redundant_constraints_2D`). Higher dimensional constraints, or ones
+    without a full-dimensional feasible region, take one LP each.
+    """
+    try:
+        G_full = np.asarray(G_full, dtype=np.float)
+        h_full = np.asarray(h_full, dtype=np.float).reshape(-1)
+    except (TypeError, ValueError):
+        logging.error('ERROR! Not able to convert arrays into matrices.')
+        return None, None
+    if G_full.ndim == 2 and G_full.shape[1] == 2:
+        n = G_full.shape[0]
+        if break_index > 0:
+            n = min(n, break_index + 1)
+        result = _redundant_constraints_2D(G_full, h_full, n, tol)
+        if result is not None:
+            redundant_constraints = [i for i, r in enumerate(result)
+                                     if r['is redundant']]
+            if verbose:
+                logging.info('Redundant constraints: {}'
+                             .format(redundant_constraints))
+            return result, redundant_constraints
+
     result = []
     redundant_constraints = []
     feasible = []
@@ -113,7 +93,7 @@ def find_redundant_constraints(G_full, h_full, break_index=-1, verbose=False):
         else:
             feasible.append((True))
 
-        is_redundant = optimal_val <= beta
+        is_redundant = optimal_val <= beta + tol * max(1, abs(beta))
         if is_redundant:
             redundant_constraints.append(i)
         
@@ -134,6 +114,133 @@ def find_redundant_constraints(G_full, h_full, break_index=-1, verbose=False):
 
     return result, redundant_constraints
 
+def _redundant_constraints_2D(G, h, n=None, tol=1E-6, hull_tol=1E-9):
+    """Check the first `n` constraints of Gx <= h in two dimensions.
+
+    With a point x0 strictly inside the feasible region (its Chebyshev
+    centre, from one LP), each constraint becomes p_i.y <= 1 for
+    y = x - x0, with p_i = G_i / (h_i - G_i.x0). By LP duality, the
+    maximum of G_i.y subject to the other constraints is the gauge of G_i
+    over the convex hull P of the origin and the other p_j, read off P's
+    edges. P only differs from the full hull when p_i is one of its
+    vertices, so one O(n log n) hull is built, plus one per non-redundant
+    constraint.
+
+    Returns
+    -------
+    list or None
+        The optimal value, optimal point and redundancy of each
+        constraint, as from `find_redundant_constraints`, or None if the
+        feasible region is empty or not full-dimensional.
+    """
+    num_constraints = G.shape[0]
+    if n is None:
+        n = num_constraints
+    norms = np.sqrt((G ** 2).sum(axis=1))
+    if num_constraints == 0 or (norms <= hull_tol).any():
+        return None
+
+    # Chebyshev centre: max r s.t. G x + r |G_i| <= h and r <= 1
+    A = np.vstack((np.column_stack((G, norms)), [0, 0, 1]))
+    b = np.hstack((h, 1))
+    solvers.options['show_progress'] = False
+    try:
+        sol = solvers.lp(matrix([0., 0., -1.]), matrix(A), matrix(b))
+    except ValueError:
+        # All constraints are parallel
+        return None
+    if sol['status'] != 'optimal':
+        return None
+    centre = np.asarray(sol['x']).reshape(-1)
+    if centre[2] <= 1E-6:
+        # Within the LP's accuracy of an empty or lower-dimensional region
+        return None
+    x0 = centre[:2]
+
+    # Dual points, with the origin last
+    slack = h - G.dot(x0)
+    points = np.vstack((G / slack[:, None], np.zeros(2)))
+    scale = np.abs(points).max()
+
+    def edges(indices):
+        """Outward normals and offsets of the hull of `points[indices]`."""
+        hull = [indices[k] for k in _convex_hull_2D(points[indices],
+                                                     hull_tol)]
+        if len(hull) < 3:
+            return None
+        a = points[hull]
+        d = np.roll(a, -1, axis=0) - a
+        normals = np.column_stack((d[:, 1], -d[:, 0]))
+        return normals, (normals * a).sum(axis=1)
+
+    all_indices = range(num_constraints + 1)
+    full_hull = set(all_indices[k] for k in _convex_hull_2D(points,
+                                                             hull_tol))
+    full_edges = edges(all_indices)
+    if full_edges is None:
+        return None
+
+    result = []
+    for i in range(n):
+        if i in full_hull:
+            hull_edges = edges(all_indices[:i] + all_indices[i + 1:])
+            if hull_edges is None:
+                return None
+        else:
+            hull_edges = full_edges
+        normals, offsets = hull_edges
+
+        # Gauge of G_i: unbounded if it leaves P through an edge at the
+        # origin, otherwise reached on the edge it leaves through
+        steps = normals.dot(G[i])
+        at_origin = offsets <= hull_tol * scale * np.abs(normals).sum(axis=1)
+        if (steps[at_origin] > hull_tol * norms[i] *
+                np.abs(normals[at_origin]).sum(axis=1)).any():
+            optimal_val = np.inf
+            optimal_pt = None
+        else:
+            gauges = np.where(at_origin, -np.inf,
+                              steps / np.where(at_origin, 1, offsets))
+            k = np.argmax(gauges)
+            optimal_val = G[i].dot(x0) + gauges[k]
+            optimal_pt = x0 + normals[k] / offsets[k]
+
+        beta = h[i]
+        is_redundant = optimal_val <= beta + tol * max(1, abs(beta))
+        result.append({'optimal value': optimal_val,
+                       'optimal point': optimal_pt,
+                       'is redundant': is_redundant,
+                       })
+    return result
+
+
+def _convex_hull_2D(points, tol=0):
+    """Indices of the strict vertices of a 2D convex hull.
+
+    Uses Andrew's monotone chain, so points on the hull's edges (within
+    `tol` of the points' extent) aren't vertices.
+    """
+    scale = np.abs(points).max()
+    order = np.lexsort((points[:, 1], points[:, 0]))
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    def chain(indices):
+        vertices = []
+        for i in indices:
+            while len(vertices) >= 2 and cross(points[vertices[-2]],
+                                               points[vertices[-1]],
+                                               points[i]) <= tol * scale ** 2:
+                vertices.pop()
+            vertices.append(i)
+        return vertices
+
+    lower = chain(order)
+    upper = chain(order[::-1])
+    return lower[:-1] + upper[:-1]
+
+
 def remove_redundant_constraints(G, h, **kwargs):
     """Remove redundant inequalities from a set of inequalities Gx <= h.
     """
@@ -265,8 +372,8 @@ def geometric_softmax_model(models, measurements, verbose=False, state_spec='x y
         G, h = generate_inequalities(sm, measurements[i])
         G_full.append(G)
         h_full.append(h)
-    G_full = np.asarray(G_full).reshape(-1, G.shape[1])
-    h_full = np.asarray(h_full).reshape(-1)
+    G_full = np.vstack(G_full)
+    h_full = np.hstack(h_full)
 
     # Remove redundant constraints to get weights and biases
     G, h = remove_redundant_constraints(G_full, h_full, verbose=verbose)
@@ -1,7 +1,6 @@
 from __future__ import division
 import logging
 import numpy as np
-import copy
 
 
 from cops_and_robots.fusion.softmax import Softmax
@@ -67,40 +66,16 @@ class BinarySoftmax(Softmax):
 
     def categorical_to_binary(self):
         """Transforms a m>2 class softmax model to multiple binary models.
+
+        Each binary model is a `BinaryView` sharing the categorical model's
+        weights and biases, rather than a copy of it.
         """
         self.binary_models = {}
 
         # Create new binary softmax model for each class
         for class_label in self.softmax_model.class_labels:
-            new_softmax = copy.deepcopy(self.softmax_model)
-            
-            # If MMS model use subclass labels
-            if hasattr(new_softmax, 'subclasses'):
-                new_softmax.labels = []
-                for l in new_softmax.subclass_labels:
-                    j = l.find('__')
-                    if j > -1:
-                        l = l[:j] 
-                    new_softmax.labels.append(l)
-                del new_softmax.subclasses
-            else:
-                new_softmax.labels = new_softmax.class_labels
-            del new_softmax.classes
-            
-            if hasattr(new_softmax,'probs'):
-                del new_softmax.probs
-            if hasattr(new_softmax,'subclass_probs'):
-                del new_softmax.subclass_probs
-
-            for i, new_label in enumerate(new_softmax.labels):
-                if new_label != class_label:
-                    new_label = 'not ' + class_label
-                    new_softmax.labels[i] = new_label.title()
-
-            new_softmax.num_classes = len(new_softmax.labels)
-            new_softmax._define_classes(new_softmax.labels)
-
-            self.binary_models[class_label] = new_softmax
+            self.binary_models[class_label] = BinaryView(self.softmax_model,
+                                                         class_label)
 
     def probability(self, state=None, class_=None):
         # if class_ == None:
@@ -135,4 +110,71 @@ class BinarySoftmax(Softmax):
     #         except KeyError:
     #             logging.debug('No class {} in {}.'.format(key, binary_model))
     #         except e:
-    #             raise e
\ No newline at end of file
+    #             raise e
+
+
+class BinaryView(Softmax):
+    """A binary 'X' and 'Not X' view of one class of a softmax model.
+
+    The view shares the categorical model's weight and bias arrays (and
+    state grid), and only relabels its subclasses. Since the terms are the
+    same, the probability of 'X' is the categorical probability of class
+    'X', so probabilities are delegated to the categorical model while
+    neither model has been moved since the view was made. Moves rebind
+    the weights and biases rather than writing into them, so moving either
+    model leaves the other's parameters untouched.
+
+    Parameters
+    ----------
+    softmax_model : Softmax
+        The categorical softmax model to view.
+    class_label : str
+        The label of the class that becomes 'X'.
+
+    """
+
+    def __init__(self, softmax_model, class_label):
+        # Share (not copy) the categorical model's attributes
+        self.__dict__.update(softmax_model.__dict__)
+        for attr in ['classes', 'subclasses', 'subclass_labels',
+                     'num_subclasses', 'probs', 'subclass_probs']:
+            self.__dict__.pop(attr, None)
+        self.softmax_model = softmax_model
+        self.class_label = class_label
+        self.not_label = ('not ' + class_label).title()
+
+        # If MMS model use subclass labels
+        if hasattr(softmax_model, 'subclasses'):
+            labels = softmax_model.subclass_labels
+        else:
+            labels = softmax_model.class_labels
+        self.labels = []
+        for label in labels:
+            j = label.find('__')
+            if j > -1:
+                label = label[:j]
+            if label != class_label:
+                label = self.not_label
+            self.labels.append(label)
+
+        self.num_classes = len(self.labels)
+        self._define_classes(self.labels)
+        self._shared_versions = (self._parameter_version,
+                                 softmax_model._parameter_version)
+
+    def probability(self, state=None, class_=None, find_class_probs=True,
+                    find_subclass_probs=False):
+        shared = (self._parameter_version,
+                  self.softmax_model._parameter_version) \
+            == self._shared_versions
+        if not shared or state is None or class_ not in self.classes \
+                or find_subclass_probs:
+            return super(BinaryView, self).probability(state, class_,
+                                                       find_class_probs,
+                                                       find_subclass_probs)
+
+        p = self.softmax_model.probability(state, self.class_label)
+        if class_ == self.not_label:
+            p = 1 - p
+        self.classes[class_].probs = p
+        return p
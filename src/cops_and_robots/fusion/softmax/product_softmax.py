@@ -0,0 +1,260 @@
+from __future__ import division
+import logging
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+from cops_and_robots.fusion.softmax import Softmax, SoftmaxClass
+
+
+class ProductSoftmax(Softmax):
+    """A factored product of multiple softmax models.
+
+    The product of `n` models has one term per combination of their
+    (sub)classes, and one joint class per combination of their class
+    labels, labelled as e.g. 'Front + Not Near'. Both the normalizer and a
+    joint class' numerator factor over the models, so the probability of
+    a joint class (or term) is the product of the probabilities of its
+    labels under each model. Evaluating it never enumerates the terms.
+
+    Joint classes and terms are made when first looked up in `classes` or
+    `subclasses`, and the full (M x d) weights and biases only when asked
+    for (e.g. by VB).
+
+    Parameters
+    ----------
+    models : list of Softmax
+        The softmax models to multiply. These shouldn't be moved once
+        they're part of a product.
+
+    """
+
+    def __init__(self, models):
+        self.models = models
+        first = models[0]
+        self.bounds = first.bounds
+        self.state_spec = first.state_spec
+        self.state_labels = first.state_labels
+        self.resolution = first.resolution
+        self.res = first.res
+        self.tol = first.tol
+        self.poly = None
+        self.has_subclasses = True
+        self.auto_combine_mms = True
+        self._invalidate_grid_cache()
+
+        # Terms of each model, and the terms making up each of its classes
+        self.factor_weights = []
+        self.factor_biases = []
+        self.factor_keys = []
+        self.factor_classes = []
+        for sm in models:
+            weights, biases = sm.world_parameters()
+            biases = np.asarray(biases, dtype=np.float).reshape(-1)
+            weights = np.asarray(weights, dtype=np.float)\
+                .reshape(biases.size, -1)
+            self.factor_weights.append(weights)
+            self.factor_biases.append(biases)
+
+            if sm.has_subclasses:
+                keys = list(sm.subclass_labels)
+            else:
+                keys = list(sm.class_labels)
+            self.factor_keys.append(keys)
+
+            classes = OrderedDict()
+            for t, key in enumerate(keys):
+                i = key.find('__')
+                if i != -1:
+                    key = key[:i]
+                classes.setdefault(key, []).append(t)
+            self.factor_classes.append(classes)
+
+        self.factor_shape = tuple(len(k) for k in self.factor_keys)
+        self.class_shape = tuple(len(c) for c in self.factor_classes)
+        self.num_params = self.factor_weights[0].shape[1]
+        self.num_subclasses = int(np.prod(self.factor_shape))
+        self.num_classes = int(np.prod(self.class_shape))
+        self._weights = None
+        self._biases = None
+
+        self.classes = _LazyClasses(self._make_class)
+        self.subclasses = _LazyClasses(self._make_subclass)
+
+    @property
+    def weights(self):
+        if self._weights is None:
+            self._combine_terms()
+        return self._weights
+
+    @property
+    def biases(self):
+        if self._biases is None:
+            self._combine_terms()
+        return self._biases
+
+    @property
+    def class_labels(self):
+        return [' + '.join(labels) for labels in
+                itertools.product(*self.factor_classes)]
+
+    def probability(self, state=None, class_=None, find_class_probs=True,
+                    find_subclass_probs=False):
+        """Map the state space to joint class probabilities.
+
+        Takes the same arguments as `Softmax.probability`. Without a
+        `class_`, this gives the (N x num_classes) probabilities of all
+        joint classes, as an outer product of each model's class
+        probabilities. Subclass probabilities are only found one term at
+        a time, by passing its label as `class_`.
+        """
+        if state is None:
+            if not hasattr(self, 'state'):
+                self._define_state()
+            state = self.state
+            using_state_space = True
+        else:
+            state = np.asarray(state)
+            using_state_space = False
+        n = state.shape[0]
+
+        if class_ is None:
+            probs = np.ones((n, 1))
+            for sm, classes in zip(self.models, self.factor_classes):
+                model_probs = np.column_stack([sm.probability(state=state,
+                                                              class_=label)
+                                               for label in classes])
+                probs = (probs[:, :, None] * model_probs[:, None, :])\
+                    .reshape(n, -1)
+            if using_state_space:
+                self.probs = probs
+                return
+            return probs
+
+        # Convert ID to string for lookup
+        if type(class_) == int or type(class_) == float:
+            class_ = self.class_labels[int(class_)]
+        try:
+            sm_class = self.classes[class_]
+        except KeyError:
+            logging.debug('Couldn\'t find class {}. Looking in subclasses.'
+                          .format(class_))
+            sm_class = self.subclasses[class_]
+
+        p = np.ones(n)
+        for sm, label in zip(self.models, sm_class.factor_labels):
+            p = p * sm.probability(state=state, class_=label)
+        sm_class.probs = p
+
+        if using_state_space and class_ in self.classes:
+            self.probs = np.zeros((n, self.num_classes))
+            self.probs[:, sm_class.id] = p
+        return p
+
+    def _parse_label(self, label):
+        """Split a joint (sub)class label into each model's class label.
+        """
+        k = None
+        i = label.rfind('__')
+        if i != -1:
+            label, k = label[:i], int(label[i + 2:])
+        labels = label.split(' + ')
+        if len(labels) != len(self.models):
+            raise KeyError(label)
+        try:
+            term_sets = [classes[l] for classes, l
+                         in zip(self.factor_classes, labels)]
+        except KeyError:
+            raise KeyError(label)
+        return label, labels, term_sets, k
+
+    def _make_subclass(self, subclass_label):
+        """Make the term with the given (numbered) joint label.
+
+        Like `Softmax._define_classes`, the k-th term (in product order)
+        sharing a joint label with others is labelled 'label__k'.
+        """
+        label, _, term_sets, k = self._parse_label(subclass_label)
+        counts = [len(terms) for terms in term_sets]
+        num_terms = int(np.prod(counts))
+        if (k is None) != (num_terms == 1) \
+                or (k is not None and k >= num_terms):
+            raise KeyError(subclass_label)
+
+        positions = np.unravel_index(k or 0, counts)
+        terms = [term_set[i] for term_set, i in zip(term_sets, positions)]
+        weights = np.sum([w[t] for w, t in zip(self.factor_weights, terms)],
+                         axis=0)
+        bias = np.sum([b[t] for b, t in zip(self.factor_biases, terms)])
+        id_ = int(np.ravel_multi_index(terms, self.factor_shape))
+
+        sm_class = SoftmaxClass(id_=id_,
+                                label=subclass_label,
+                                weights=weights,
+                                bias=bias,
+                                softmax_collection=self,
+                                )
+        sm_class.factor_labels = [keys[t] for keys, t
+                                  in zip(self.factor_keys, terms)]
+        return sm_class
+
+    def _make_class(self, class_label):
+        """Make a joint class, with all of its terms as subclasses.
+        """
+        if class_label.find('__') != -1:
+            raise KeyError(class_label)
+        _, labels, term_sets, _ = self._parse_label(class_label)
+        num_terms = int(np.prod([len(terms) for terms in term_sets]))
+        if num_terms == 1:
+            subclass_labels = [class_label]
+        else:
+            subclass_labels = ['{}__{}'.format(class_label, k)
+                               for k in range(num_terms)]
+
+        ids = [list(classes).index(l) for classes, l
+               in zip(self.factor_classes, labels)]
+        id_ = int(np.ravel_multi_index(ids, self.class_shape))
+        first = self.subclasses[subclass_labels[0]]
+        sm_class = SoftmaxClass(id_=id_,
+                                label=class_label,
+                                weights=first.weights,
+                                bias=first.bias,
+                                color=Softmax.class_colors[
+                                    id_ % len(Softmax.class_colors)],
+                                cmap=Softmax.class_cmaps[
+                                    id_ % len(Softmax.class_cmaps)],
+                                softmax_collection=self,
+                                )
+        for subclass_label in subclass_labels:
+            sm_class.add_subclass(self.subclasses[subclass_label])
+        sm_class.factor_labels = labels
+        return sm_class
+
+    def _combine_terms(self):
+        """Sum each model's weights and biases over all combinations.
+        """
+        n = len(self.models)
+        weights = np.zeros(self.factor_shape + (self.num_params,))
+        biases = np.zeros(self.factor_shape)
+        for i, (w, b) in enumerate(zip(self.factor_weights,
+                                       self.factor_biases)):
+            shape = [1] * n
+            shape[i] = -1
+            weights = weights + w.reshape(shape + [self.num_params])
+            biases = biases + b.reshape(shape)
+        self._weights = weights.reshape(-1, self.num_params)
+        self._biases = biases.reshape(-1)
+
+
+class _LazyClasses(dict):
+    """A dict of softmax classes, each made when first looked up."""
+
+    def __init__(self, make_class):
+        super(_LazyClasses, self).__init__()
+        self.make_class = make_class
+
+    def __missing__(self, label):
+        sm_class = self.make_class(label)
+        self[label] = sm_class
+        return sm_class
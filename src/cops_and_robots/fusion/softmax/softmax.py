@@ -14,9 +14,16 @@ __email__ = "nick.sweet@colorado.edu"
 __status__ = "Development"
 
 import logging
+import itertools
+from collections import OrderedDict
+
 import numpy as np
 
 from shapely.geometry import box, Polygon
+from shapely import affinity
+
+from cops_and_robots.fusion.probability import (shared_grid, shared_states,
+                                                is_shared_grid)
 
 import warnings  # To suppress nolabel warnings
 warnings.filterwarnings("ignore", message=".*cannot be automatically added.*")
@@ -122,6 +129,9 @@ class Softmax(object):
                     'seagreen', 'darkviolet', 'orangered', 'deeppink', 
                     'sandybrown', 'lightgray', 'navajowhite']
 
+    # Total size of cached class probabilities over state grids
+    grid_cache_max_bytes = 2 ** 27
+
     # Load methods from external files
     from _visualization import (plot,
                                 _plot_probs,
@@ -246,7 +256,7 @@ class Softmax(object):
             using_state_space = True
             dummy_weights = np.zeros(0)
         else:  # Use a specific state
-            state = np.array(state)
+            state = np.asarray(state)
 
             # old state version
             # state = state.reshape(-1,self.weights.shape[1])
@@ -296,63 +306,91 @@ class Softmax(object):
                 raise e
         using_all_classes = len(classes) == len(all_classes)
 
-        # Set a few initial values
-        if using_state_space:
-            M = np.zeros(self.X.size)
-            normalizer = np.zeros(self.X.size)
-            if find_class_probs:
-                self.probs = np.zeros((self.X.size, self.num_classes))
-            if find_subclass_probs:
-                self.subclass_probs = np.zeros((self.X.size, self.num_subclasses))
-        else:
-            M = 0
-            normalizer = 0
-
-        # Subtract a constant from all exponent terms to prevent overflow:
-        # http://ufldl.stanford.edu/wiki/index.php/Exercise:Softmax_Regression
-        for _, sm_class in all_classes.iteritems():
-            weights = np.hstack((sm_class.weights, dummy_weights))
-            m = state .dot (weights) + sm_class.bias
-            M = np.maximum(m, M)
-
-        # Define the softmax normalization term
-        for _, sm_class in all_classes.iteritems():
-            weights = np.hstack((sm_class.weights, dummy_weights))
-            exp_term = np.dot(state, weights) + sm_class.bias
-            normalizer += np.exp(exp_term - M)
-
-        # Find class probabilities
+        # Reuse probabilities of a single class over a shared state grid
+        grid_cache_key = None
+        if class_ is not None and not find_subclass_probs \
+                and is_shared_grid(state):
+            grid_cache_key = (id(self), self._parameter_version, class_,
+                              id(state))
+            grid_state = state
+            cached = _grid_cache_get(grid_cache_key)
+            if cached is not None:
+                cached_probs, collection_probs = cached
+                classes[class_].probs = cached_probs
+                if collection_probs is not None:
+                    self.probs = collection_probs
+                return cached_probs
+
+        # Map states into the model's frame, if it has been placed
+        if getattr(self, 'frame_rotation', None) is not None:
+            state = self._to_frame(state)
+
+        # Collect each (sub)class term once, so all logits come from a
+        # single matrix product
+        terms = []
+        term_rows = {}
+        def term_row(sm_class):
+            if id(sm_class) not in term_rows:
+                term_rows[id(sm_class)] = len(terms)
+                terms.append(sm_class)
+            return term_rows[id(sm_class)]
+
+        normalizer_rows = [term_row(sm_class)
+                           for _, sm_class in all_classes.iteritems()]
+
+        # Output (sub)classes, each summing the terms of its segment
+        outputs = []
+        segment_rows = []
         if find_class_probs:
             for _, sm_class in classes.iteritems():
-
                 # Find probability for superclasses or regular classes
                 if len(sm_class.subclasses) > 0:
-                    exp_term = 0
-                    for _, subclass in sm_class.subclasses.iteritems():
-                        weights = np.hstack((subclass.weights, dummy_weights))
-                        exp_term += np.exp(np.dot(state, weights)
-                                           + subclass.bias - M)
+                    rows = [term_row(subclass) for _, subclass
+                            in sm_class.subclasses.iteritems()]
                 else:
-                    weights = np.hstack((sm_class.weights, dummy_weights))
-                    exp_term = np.exp(np.dot(state, weights) + sm_class.bias - M)
-                sm_class.probs = exp_term / normalizer
-
-                # Assign probabilities to the softmax collection
-                if using_state_space:
-                    self.probs[:, sm_class.id] = sm_class.probs
-
-        # Find subclass probabilities
+                    rows = [term_row(sm_class)]
+                outputs.append((sm_class, 'probs'))
+                segment_rows.append(rows)
         if find_subclass_probs:
             for _, sm_class in subclasses.iteritems():
-                weights = np.hstack((sm_class.weights, dummy_weights))
-                exp_term = np.exp(np.dot(state, weights)
-                                      + sm_class.bias - M)
-                sm_class.probs = exp_term / normalizer
+                outputs.append((sm_class, 'subclass_probs'))
+                segment_rows.append([term_row(sm_class)])
+
+        weights = np.array([sm_class.weights for sm_class in terms],
+                           dtype=np.float).reshape(len(terms), -1)
+        biases = np.array([sm_class.bias for sm_class in terms],
+                          dtype=np.float).reshape(-1)
+        logits = weights .dot (state[:, :weights.shape[1]].T) \
+            + biases[:, None]
+
+        # Subtract the max logit from all exponent terms to prevent overflow:
+        # http://ufldl.stanford.edu/wiki/index.php/Exercise:Softmax_Regression
+        # Terms below exp(-700) are floored there, as underflowing to
+        # zero is far slower and changes nothing at double precision
+        M = logits[normalizer_rows].max(axis=0)
+        exp_terms = np.exp(np.maximum(logits - M, -700))
+
+        # Sum the normalizer and each output's terms as segment sums
+        segments = np.zeros((len(terms), len(outputs) + 1))
+        for i, rows in enumerate(segment_rows):
+            segments[rows, i] = 1
+        segments[normalizer_rows, -1] = 1
+        sums = segments.T .dot (exp_terms)
+        output_probs = sums[:-1] / sums[-1]
 
-                # Assign probabilities to the softmax collection
-                if using_state_space:
-                    self.subclass_probs[:, sm_class.id] = sm_class.probs
+        if using_state_space:
+            if find_class_probs:
+                self.probs = np.zeros((self.X.size, self.num_classes))
+            if find_subclass_probs:
+                self.subclass_probs = np.zeros((self.X.size,
+                                                self.num_subclasses))
+        for i, (sm_class, collection_probs) in enumerate(outputs):
+            sm_class.probs = output_probs[i]
 
+            # Assign probabilities to the softmax collection
+            if using_state_space:
+                getattr(self, collection_probs)[:, sm_class.id] = \
+                    sm_class.probs
 
         # Check probs to make sure everything sums to 1
         if using_state_space and using_all_classes:
@@ -367,6 +405,15 @@ class Softmax(object):
                                   'the state!')
                 raise e
 
+        if grid_cache_key is not None:
+            sm_class.probs.flags.writeable = False
+            collection_probs = None
+            if using_state_space and find_class_probs:
+                collection_probs = self.probs
+                collection_probs.flags.writeable = False
+            _grid_cache_put(grid_cache_key, sm_class.probs, collection_probs,
+                            grid_state, self.grid_cache_max_bytes)
+
         # Return the probability if looking for a single state
         if not using_state_space or not using_all_classes:
             return sm_class.probs
@@ -380,6 +427,7 @@ class Softmax(object):
     def add_classes(self, weights, biases, labels=None, steepness=1, poly=None):
         """Add m>=1 classes to the current Softmax model.
         """
+        self._invalidate_grid_cache()
         self.weights = np.vstack((self.weights, weights))
         self.biases = np.hstack((self.biases, biases))
         self.steepness = np.hstack((self.steepness, steepness))
@@ -441,6 +489,8 @@ class Softmax(object):
 
     def move(self, new_pose=None, translation=None, rotation=None,
              *args, **kwargs):
+        self._invalidate_grid_cache()
+
         # Make sure to save original weights & biases
         if not hasattr(self, 'original_weights'):
             self.original_weights = np.copy(self.weights)
@@ -459,6 +509,60 @@ class Softmax(object):
         else:
             self._move_absolute(new_pose, *args, **kwargs)
 
+    def set_frame(self, pose, rotation_unit='degrees'):
+        """Place the model's own frame at `pose` without moving its weights.
+
+        Unlike `move`, this keeps the weights, biases and classes fixed in
+        the model's frame: `probability` maps states into that frame with
+        one affine transform instead. `world_parameters` gives the
+        equivalent moved weights and biases. Don't mix with `move`.
+        """
+        pose = np.array(pose, dtype=np.float).ravel()
+        if pose.size < 2 or pose.size > 3:
+            raise ValueError('Pose should have 2 or 3 values. {} was given.'
+                             .format(pose))
+        elif pose.size == 2:
+            pose = np.hstack((pose, np.zeros(1)))
+        theta = pose[2]
+        if rotation_unit == 'degrees':
+            theta = np.deg2rad(theta)
+
+        # Rotation of world offsets into the model's frame
+        c, s = np.cos(theta), np.sin(theta)
+        self.frame_rotation = np.array([[c, s],
+                                        [-s, c]])
+        self.frame_translation = pose[0:2]
+        self.frame_pose = pose
+        self._invalidate_grid_cache()
+
+        # Place the polygon in the world frame
+        if getattr(self, 'poly', None) is not None:
+            if not hasattr(self, 'frame_poly'):
+                self.frame_poly = self.poly
+            poly = affinity.rotate(self.frame_poly, theta, origin=(0, 0),
+                                   use_radians=True)
+            self.poly = affinity.translate(poly, pose[0], pose[1])
+
+    def _to_frame(self, state):
+        """Map (N x n) world states into the model's frame."""
+        framed = np.array(state, dtype=np.float)
+        framed[:, 0:2] = (framed[:, 0:2] - self.frame_translation) \
+            .dot(self.frame_rotation.T)
+        return framed
+
+    def world_parameters(self):
+        """Weights and biases of the model in the world frame.
+
+        These are the model's own weights and biases unless it has been
+        placed with `set_frame`.
+        """
+        if getattr(self, 'frame_rotation', None) is None:
+            return self.weights, self.biases
+        weights = np.array(self.weights, dtype=np.float)
+        weights[:, 0:2] = weights[:, 0:2] .dot (self.frame_rotation)
+        biases = self.biases - weights[:, 0:2] .dot (self.frame_translation)
+        return weights, biases
+
     def _move_absolute(self, new_pose, rotation_unit='degrees'):
 
         # Validate inputs
@@ -484,9 +588,9 @@ class Softmax(object):
         translation = -new_pose[0:2]
 
         # <>TODO: add rotation point
-        # Rotate about the origin
-        for i, weights in enumerate(self.original_weights):
-            self.weights[i] = weights.dot(rotation)
+        # Rotate about the origin (into new arrays, since views like
+        # BinaryView may share the current ones)
+        self.weights = self.original_weights .dot (rotation)
 
         # Translate
         self.biases = self.original_biases + self.weights .dot (translation)
@@ -561,8 +665,7 @@ class Softmax(object):
         self.biases = self.biases + self.weights .dot (rotation_point)
 
         # Rotate
-        for i, weights in enumerate(self.weights):
-            self.weights[i] = weights.dot(rotation)
+        self.weights = self.weights .dot (rotation)
 
         # Translate back to the original point, then apply actual translation
         self.biases = self.biases + self.weights .dot (-rotation_point)
@@ -586,6 +689,7 @@ class Softmax(object):
 
         """
         from softmax_class import SoftmaxClass
+        self._invalidate_grid_cache()
 
         # Find unique class_labels
         unique_labels = []
@@ -600,6 +704,11 @@ class Softmax(object):
             and not hasattr(self, 'subclasses'):
             self.has_subclasses = False
             logging.debug('Doesn\'t have subclasses - no combinations needed!')
+
+            # Keep the classes on the current (possibly moved) parameters
+            for class_ in self.classes.itervalues():
+                class_.weights = self.weights[class_.id]
+                class_.bias = self.biases[class_.id]
             return
         else:
             self.has_subclasses = True
@@ -694,50 +803,29 @@ class Softmax(object):
             self.state = self.X.T
             self.ndim = 1
         elif state_spec == 'x y':
-            self.X, self.Y = np.mgrid[bounds[0]:bounds[2]:res,
-                                      bounds[1]:bounds[3]:res]
-            self.state = np.dstack((self.X, self.Y))
-            self.state = np.reshape(self.state, (self.X.size, 2))
+            self.X, self.Y, _ = shared_grid(bounds[:4], res)
+            self.state = shared_states(bounds[:4], res)
             self.ndim = 2
         elif state_spec == 'x x_dot':
-            self.X, self.X_dot = np.mgrid[bounds[0]:bounds[2]:res,
-                                          bounds[1]:bounds[3]:res]
-            self.state = np.dstack((self.X, self.X_dot))
-            self.state = np.reshape(self.state, (self.X.size, 2))
+            self.X, self.X_dot, _ = shared_grid(bounds[:4], res)
+            self.state = shared_states(bounds[:4], res)
             self.ndim = 2
         elif state_spec == 'x y_dot':
-            self.X, self.Y_dot = np.mgrid[bounds[0]:bounds[2]:res,
-                                          bounds[1]:bounds[3]:res]
-            self.state = np.dstack((self.X, self.Y_dot))
-            self.state = np.reshape(self.state, (self.X.size, 2))
+            self.X, self.Y_dot, _ = shared_grid(bounds[:4], res)
+            self.state = shared_states(bounds[:4], res)
             self.ndim = 2
         elif state_spec == 'x y x_dot':
-            self.X, self.Y, self.X_dot = \
-                np.mgrid[bounds[0]:bounds[3]:res,
-                         bounds[1]:bounds[4]:res,
-                         bounds[2]:bounds[5]:res,
-                         ]
-            self.state = np.dstack((self.X, self.Y, self.X_dot))
-            self.state = np.reshape(self.state, (self.X.size, 3))
+            self.X, self.Y, self.X_dot, _ = shared_grid(bounds[:6], res)
+            self.state = shared_states(bounds[:6], res)
             self.ndim = 3
         elif state_spec == 'x y y_dot':
-            self.X, self.Y, self.Y_dot = \
-                np.mgrid[bounds[0]:bounds[3]:res,
-                         bounds[1]:bounds[4]:res,
-                         bounds[2]:bounds[5]:res,
-                         ]
-            self.state = np.dstack((self.X, self.Y, self.Y_dot))
-            self.state = np.reshape(self.state, (self.X.size, 3))
+            self.X, self.Y, self.Y_dot, _ = shared_grid(bounds[:6], res)
+            self.state = shared_states(bounds[:6], res)
             self.ndim = 3
         elif state_spec == 'x y x_dot y_dot':
-            self.X, self.Y, self.X_dot, self.Y_dot = \
-                np.mgrid[bounds[0]:bounds[4]:res,
-                         bounds[1]:bounds[5]:res,
-                         bounds[2]:bounds[6]:res,
-                         bounds[3]:bounds[7]:res,
-                         ]
-            self.state = np.dstack((self.X, self.Y, self.X_dot, self.Y_dot))
-            self.state = np.reshape(self.state, (self.X.size, 4))
+            self.X, self.Y, self.X_dot, self.Y_dot, _ = \
+                shared_grid(bounds[:8], res)
+            self.state = shared_states(bounds[:8], res)
             self.ndim = 4
         elif state_spec == 'x y x^2 y^2 2xy':
             self.ndim = 4
@@ -773,11 +861,21 @@ class Softmax(object):
         # logging.debug("Biases generated from normals:\n {}"
         #              .format(self.biases))
 
+    def _invalidate_grid_cache(self):
+        """Give the model a new parameter version for the grid cache.
+
+        Entries of earlier versions would never be looked up again, so
+        they are dropped.
+        """
+        self._parameter_version = next(_parameter_versions)
+        _grid_cache_drop(id(self))
+
     def _define_classes(self, labels=None):
         """Sets labels and colors for all classes.
 
         """
         from cops_and_robots.fusion.softmax import SoftmaxClass
+        self._invalidate_grid_cache()
 
         # Check for unique labels
         if labels is not None:
@@ -822,6 +920,77 @@ class Softmax(object):
             self._combine_mms()
 
 
+# Class probabilities over shared state grids, most recently used last
+_grid_cache = OrderedDict()
+_grid_cache_nbytes = 0
+_grid_cache_keys = {}  # Keys of each model's entries, by model id
+_parameter_versions = itertools.count()
+
+
+def _grid_cache_get(key):
+    """Cached class probabilities and collection probabilities, or None."""
+    try:
+        entry = _grid_cache.pop(key)
+    except KeyError:
+        return None
+    _grid_cache[key] = entry
+    return entry[:2]
+
+
+def _grid_cache_put(key, probs, collection_probs, state, max_bytes):
+    """Cache `probs` (and the model's `probs` array over its own state
+    space, if given).
+
+    A reference to the shared grid `state` is kept so its id can't be
+    reused while the entry exists. The grid belongs to the shared-grid
+    registry rather than the cache, so it isn't counted in the cache size.
+    """
+    _grid_cache_remove(key)
+    _grid_cache[key] = (probs, collection_probs, state)
+    _grid_cache_keys.setdefault(key[0], set()).add(key)
+    _grid_cache_add_nbytes(key, 1)
+    while _grid_cache_nbytes > max_bytes and _grid_cache:
+        _grid_cache_remove(next(iter(_grid_cache)))
+
+
+def _grid_cache_remove(key):
+    if key not in _grid_cache:
+        return
+    _grid_cache_add_nbytes(key, -1)
+    del _grid_cache[key]
+    keys = _grid_cache_keys[key[0]]
+    keys.discard(key)
+    if not keys:
+        del _grid_cache_keys[key[0]]
+
+
+def _grid_cache_add_nbytes(key, sign):
+    global _grid_cache_nbytes
+    probs, collection_probs, _ = _grid_cache[key]
+    _grid_cache_nbytes += sign * probs.nbytes
+    if collection_probs is not None:
+        _grid_cache_nbytes += sign * collection_probs.nbytes
+
+
+def _grid_cache_drop(model_id):
+    """Drop all cached entries of one model."""
+    for key in list(_grid_cache_keys.get(model_id, ())):
+        _grid_cache_remove(key)
+
+
+def grid_cache_nbytes():
+    """Bytes used by cached softmax probabilities over state grids."""
+    return _grid_cache_nbytes
+
+
+def clear_grid_cache():
+    """Drop all cached softmax probabilities over state grids."""
+    global _grid_cache_nbytes
+    _grid_cache.clear()
+    _grid_cache_keys.clear()
+    _grid_cache_nbytes = 0
+
+
 def normals_from_polygon(polygon):
     """Get all unit normal vectors from the exterior of a polygon.
 
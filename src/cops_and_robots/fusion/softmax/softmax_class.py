@@ -167,9 +167,15 @@ class SoftmaxClass(object):
     def find_class_neighbours(self):
         """Method of a Softmax class to find its neighbour classes.
 
-        Applies to subclasses as well as classes.
+        Applies to subclasses as well as classes. Neighbours are kept until
+        the parent model's parameters change.
         """
         from _synthesis import generate_inequalities, find_redundant_constraints
+        version = getattr(self.softmax_collection, '_parameter_version', None)
+        if hasattr(self, 'neighbours') and version is not None \
+                and getattr(self, '_neighbours_version', None) == version:
+            return
+
         G, h = generate_inequalities(self.softmax_collection, self.label)
         results, _ = find_redundant_constraints(G, h)
 
@@ -186,10 +192,10 @@ class SoftmaxClass(object):
                 neighbours.append(label)
             i += 1
         self.neighbours = neighbours
+        self._neighbours_version = version
 
     def find_critical_points(self, bounds=None):
-        if not hasattr(self, 'neighbours'):
-            self.find_class_neighbours()
+        self.find_class_neighbours()
         ndims = self.weights.size
 
         # Get all possible combinations of neighbours
@@ -17,9 +17,15 @@ __status__ = "Development"
 
 import logging
 import itertools
+import hashlib
+import multiprocessing
+from copy import copy
+from collections import OrderedDict
 
 import numpy as np
 from numpy.linalg import inv, det
+from scipy.linalg import cho_factor, cho_solve
+from scipy.stats import norm
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from descartes.patch import PolygonPatch
@@ -36,8 +42,6 @@ from cops_and_robots.fusion.gaussian_mixture import (GaussianMixture,
                                                      )
 from cops_and_robots.map_tools.map_elements import MapObject
 
-from numba import jit
-
 
 class VariationalBayes(object):
     """short description of VariationalBayes
@@ -69,7 +73,21 @@ class VariationalBayes(object):
                  num_mixand_samples=500,
                  weight_threshold=None,
                  mix_sm_corr_thresh=0.98,
-                 max_num_mixands=50):
+                 max_num_mixands=50,
+                 batch_mixands=True,
+                 num_workers=1,
+                 mixands_per_task=4,
+                 min_parallel_mixands=8,
+                 seed=None,
+                 min_importance_samples=None,
+                 importance_batch_size=128,
+                 target_ess=100,
+                 moment_tolerance=0.1,
+                 sampling='random',
+                 cache_size=256,
+                 cache_tolerance=1E-6,
+                 overlap_method='sampling',
+                 cubature_order=5):
         self.num_EM_convergence_loops = num_EM_convergence_loops
         self.EM_convergence_tolerance = EM_convergence_tolerance
         self.max_EM_steps = max_EM_steps
@@ -80,11 +98,68 @@ class VariationalBayes(object):
         self.weight_threshold = weight_threshold
         self.mix_sm_corr_thresh = mix_sm_corr_thresh
         self.max_num_mixands = max_num_mixands
+        self.batch_mixands = batch_mixands
+        self.num_workers = num_workers
+        self.mixands_per_task = mixands_per_task
+        self.min_parallel_mixands = min_parallel_mixands
+        self._pool = None
+        if min_importance_samples is None:
+            min_importance_samples = num_importance_samples // 4
+        self.min_importance_samples = min_importance_samples
+        self.importance_batch_size = importance_batch_size
+        self.target_ess = target_ess
+        self.moment_tolerance = moment_tolerance
+        if sampling not in ('random', 'sobol'):
+            raise ValueError("Sampling must be 'random' or 'sobol'.")
+        self.sampling = sampling
+        if overlap_method not in ('sampling', 'unscented', 'gauss-hermite'):
+            raise ValueError("Overlap method must be 'sampling', 'unscented' "
+                             "or 'gauss-hermite'.")
+        self.overlap_method = overlap_method
+        self.cubature_order = cubature_order
+
+        # LRU cache of per-mixand VBIS results
+        self.cache_size = cache_size
+        self.cache_tolerance = cache_tolerance
+        self.clear_cache()
+        if seed is None:
+            self.random_state = np.random
+        else:
+            self.random_state = np.random.RandomState(seed)
+
+    def __getstate__(self):
+        # Worker pools can't be pickled or copied
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Shut down the worker pool, if one was started.
+
+        A new pool is started by the next update that needs one.
+        """
+        pool = getattr(self, '_pool', None)
+        if pool is not None:
+            self._pool = None
+            pool.close()
+            pool.join()
+
+    def _get_pool(self):
+        """The instance's worker pool, started on first use."""
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.num_workers)
+        return self._pool
 
-    @jit(cache=True)
     def vb_update(self, measurement, likelihood, prior,
                   init_mean=0, init_var=1, init_alpha=0.5, init_xi=1):
         """Variational bayes update for Gaussian and Softmax.
+
+        The E and M steps are computed over all softmax classes at once, and
+        the posterior covariance comes from a Cholesky factorization of the
+        posterior precision.
         """
         # Likelihood values
         if hasattr(likelihood, 'subclasses'):
@@ -95,8 +170,7 @@ class VariationalBayes(object):
             m = likelihood.num_classes
             j = likelihood.classes[measurement].id
             init_xi = np.ones(likelihood.num_classes)
-        w = likelihood.weights
-        b = likelihood.biases
+        w, b = likelihood.world_parameters()
 
 
         xis, alpha, mu_hat, var_hat, prior_mean, prior_var = \
@@ -106,6 +180,14 @@ class VariationalBayes(object):
         dummy_weights = np.zeros((w.shape[0], prior.means[0].shape[0]-w.shape[1]))
         w = np.hstack((w, dummy_weights))
 
+        # Prior precision terms are constant across EM steps
+        eye = np.eye(w.shape[1])
+        prior_var_factor = cho_factor(prior_var)
+        K_p = cho_solve(prior_var_factor, eye)
+        h_p = K_p .dot (prior_mean)
+        logdet_prior_var = 2 * np.log(np.diag(prior_var_factor[0])).sum()
+        w_not_j = w.sum(axis=0) - w[j]
+
         converged = False
         EM_step = 0
 
@@ -114,56 +196,24 @@ class VariationalBayes(object):
             # STEP 1 - EXPECTATION
             ################################################################
             # PART A #######################################################
+            lambdas = self._lambda(xis)
+
+            # find h_j and K_j
+            h_j = 0.5 * (w[j] - w_not_j) + 2 * (lambdas * (alpha - b)) .dot (w)
+            K_j = 2 * (w.T * lambdas) .dot (w)
 
-            # find g_j
-            sum1 = 0
-            for c in range(m):
-                if c != j:
-                    sum1 += b[c]
-            sum2 = 0
-            for c in range(m):
-                sum2 = xis[c] / 2 \
-                    + self._lambda(xis[c]) * (xis[c] ** 2 - (b[c] - alpha) ** 2) \
-                    - np.log(1 + np.exp(xis[c]))
-            g_j = 0.5 * (b[j] - sum1) + alpha * (m / 2 - 1) + sum2
-
-            # find h_j
-            sum1 = 0
-            for c in range(m):
-                if c != j:
-                    sum1 += w[c]
-            sum2 = 0
-            for c in range(m):
-                sum2 += self._lambda(xis[c]) * (alpha - b[c]) * w[c]
-            h_j = 0.5 * (w[j] - sum1) + 2 * sum2
-
-            # find K_j
-            sum1 = 0
-            for c in range(m):
-                sum1 += self._lambda(xis[c]) * np.outer(w[c], (w[c]))
-
-            K_j = 2 * sum1
-
-            K_p = inv(prior_var)
-            g_p = -0.5 * (np.log(np.linalg.det(2 * np.pi * prior_var))) \
-                + prior_mean.T .dot (K_p) .dot (prior_var)
-            h_p = K_p .dot (prior_mean)
-
-            g_l = g_p + g_j
             h_l = h_p + h_j
             K_l = K_p + K_j
 
-            mu_hat = inv(K_l) .dot (h_l)
-            var_hat = inv(K_l)
+            K_l_factor = cho_factor(K_l)
+            var_hat = cho_solve(K_l_factor, eye)
+            mu_hat = var_hat .dot (h_l)
 
             # PART B #######################################################
-            y_cs = np.zeros(m)
-            y_cs_squared = np.zeros(m)
-            for c in range(m):
-                y_cs[c] = w[c].T .dot (mu_hat) + b[c]
-                y_cs_squared[c] = w[c].T .dot \
-                    (var_hat + np.outer(mu_hat, mu_hat.T)) .dot (w[c]) \
-                    + 2 * w[c].T .dot (mu_hat) * b[c] + b[c] ** 2
+            y_cs = w .dot (mu_hat) + b
+            y_cs_squared = np.einsum('ci,ij,cj->c', w,
+                                     var_hat + np.outer(mu_hat, mu_hat), w) \
+                + 2 * (y_cs - b) * b + b ** 2
 
             ################################################################
             # STEP 2 - MAXIMIZATION
@@ -172,18 +222,12 @@ class VariationalBayes(object):
 
                 # PART A ######################################################
                 # Find xis
-                for c in range(m):
-                    xis[c] = np.sqrt(y_cs_squared[c] + alpha ** 2 - 2 * alpha
-                                     * y_cs[c])
+                xis = np.sqrt(y_cs_squared + alpha ** 2 - 2 * alpha * y_cs)
 
                 # PART B ######################################################
                 # Find alpha
-                num_sum = 0
-                den_sum = 0
-                for c in range(m):
-                    num_sum += self._lambda(xis[c]) * y_cs[c]
-                    den_sum += self._lambda(xis[c])
-                alpha = ((m - 2) / 4 + num_sum) / den_sum
+                lambdas = self._lambda(xis)
+                alpha = ((m - 2) / 4 + lambdas .dot (y_cs)) / lambdas.sum()
 
             ################################################################
             # STEP 3 - CONVERGENCE CHECK
@@ -191,17 +235,16 @@ class VariationalBayes(object):
             if EM_step == 0:
                 prev_log_c_hat = -1000  # Arbitrary value
 
-            KLD = 0.5 * (np.log(det(prior_var) / det(var_hat)) +
-                         np.trace(inv(prior_var) .dot (var_hat)) +
-                         (prior_mean - mu_hat).T .dot (inv(prior_var)) .dot
-                         (prior_mean - mu_hat))
+            logdet_var_hat = -2 * np.log(np.diag(K_l_factor[0])).sum()
+            mean_diff = prior_mean - mu_hat
+            KLD = 0.5 * (logdet_prior_var - logdet_var_hat +
+                         np.trace(K_p .dot (var_hat)) +
+                         mean_diff .dot (K_p) .dot (mean_diff))
 
-            sum1 = 0
-            for c in range(m):
-                sum1 += 0.5 * (alpha + xis[c] - y_cs[c]) \
-                    - self._lambda(xis[c]) * (y_cs_squared[c] - 2 * alpha
-                    * y_cs[c] + alpha ** 2 - xis[c] ** 2) \
-                    - np.log(1 + np.exp(xis[c]))
+            sum1 = np.sum(0.5 * (alpha + xis - y_cs)
+                          - lambdas * (y_cs_squared - 2 * alpha * y_cs
+                                       + alpha ** 2 - xis ** 2)
+                          - np.log(1 + np.exp(xis)))
 
             # <>TODO: don't forget Mun - unobserved parents!
             # <>CHECK - WHY DO WE ADD +1 HERE??
@@ -230,60 +273,6 @@ class VariationalBayes(object):
 
         return mu_post, var_post, log_c_hat
 
-    def lwis_update(self, prior):
-        """
-
-        clustering:
-            pairwise greedy merging - compare means, weights & variances
-            salmond's method and runnals' method (better)
-
-        """
-        prior_mean = np.asarray(prior.means[0])
-        prior_var = np.asarray(prior.covariances[0])
-
-        # Importance distribution
-        q = GaussianMixture(1, prior_mean, prior_var)
-
-        # Importance sampling correction
-        w = np.zeros(num_samples)  # Importance weights
-        x = q.rvs(size=num_samples)  # Sampled points
-        x = np.asarray(x)
-        if hasattr(likelihood, 'subclasses'):
-            measurement_class = likelihood.subclasses[measurement]
-        else:
-            measurement_class = likelihood.classes[measurement]
-
-        for i in range(num_samples):
-            w[i] = prior.pdf(x[i]) \
-                * measurement_class.probability(state=x[i])\
-                / q.pdf(x[i])
-        w /= np.sum(w)  # Normalize weights
-
-        mu_hat = np.zeros_like(np.asarray(mu_VB))
-        for i in range(num_samples):
-            x_i = np.asarray(x[i])
-            mu_hat = mu_hat + x_i .dot (w[i])
-
-        var_hat = np.zeros_like(np.asarray(var_VB))
-        for i in range(num_samples):
-            x_i = np.asarray(x[i])
-            var_hat = var_hat + w[i] * np.outer(x_i, x_i) 
-        var_hat -= np.outer(mu_hat, mu_hat)
-
-        if mu_hat.size == 1 and mu_hat.ndim > 0:
-            mu_lwis = mu_hat[0]
-        else:
-            mu_lwis = mu_hat
-        if var_hat.size == 1:
-            var_lwis = var_hat[0][0]
-        else:
-            var_lwis = var_hat
-
-        logging.debug('LWIS update found mean of {} and variance of {}.'
-                     .format(mu_lwis, var_lwis))
-
-        return mu_lwis, var_lwis, log_c_hat
-
     def vbis_update(self, measurement, likelihood, prior,
                     exact_likelihoods=None, exact_measurements=None,
                     init_mean=0, init_var=1, init_alpha=0.5, init_xi=1,
@@ -307,49 +296,29 @@ class VariationalBayes(object):
         q_var = np.asarray(prior.covariances[0])
 
         # Importance distribution
-        q = GaussianMixture(1, q_mu, q_var)
+        ndims = prior.means.shape[1]
+        q = GaussianMixture.from_arrays(np.ones(1),
+                                        np.reshape(q_mu, (1, ndims)),
+                                        np.reshape(q_var, (1, ndims, ndims)))
         logging.debug('q mean = {}'.format(q.means))
 
         # Importance sampling correction
         w = np.zeros(num_samples)  # Importance weights
         x = q.rvs(size=num_samples)  # Sampled points
         x = np.asarray(x)
-        if hasattr(likelihood, 'subclasses'):
-            measurement_class = likelihood.subclasses[measurement]
-        else:
-            measurement_class = likelihood.classes[measurement]
-
 
         # Sample from all the exact classes in all the sm models from the sm product
         # sample each parent of the joint measurement from the distribution generated by the vb update
         # take the product of the prior pdf at x and all the parent likelihoods at sample points x
-        if exact_likelihoods is None:
-            likelihood_at_x = measurement_class.probability(state=x)
-        else:
-            for i, exact_likelihood in enumerate(exact_likelihoods):
-                if hasattr(exact_likelihood, 'subclasses'):
-                    exact_measurement_class = exact_likelihood.subclasses[exact_measurements[i]]
-                else:
-                    exact_measurement_class = exact_likelihood.classes[exact_measurements[i]]
-
-                if i == 0:
-                    likelihood_at_x = np.ones_like(exact_measurement_class.probability(state=x))
-                else:
-                    likelihood_at_x *= exact_measurement_class.probability(state=x)
-
+        likelihood_at_x = self._measurement_likelihood(measurement, likelihood,
+                                                       x, exact_likelihoods,
+                                                       exact_measurements)
 
         # Compute parameters using samples
         w = prior.pdf(x) * likelihood_at_x / q.pdf(x)
-        w /= np.sum(w)  # Normalize weights
-
-        mu_hat = np.sum(x.T * w, axis=-1)
-
-        # <>TODO: optimize this
-        var_hat = np.zeros_like(np.asarray(q_var))
-        for i in range(num_samples):
-            x_i = np.asarray(x[i])
-            var_hat = var_hat + w[i] * np.outer(x_i, x_i) 
-        var_hat -= np.outer(mu_hat, mu_hat)
+        mu_hat, var_hat, ess = weighted_moments(x, w)
+        logging.debug('VBIS effective sample size: {:.1f} of {}'
+                      .format(ess, num_samples))
 
         # Ensure properly formatted output
         if mu_hat.size == 1 and mu_hat.ndim > 0:
@@ -366,6 +335,258 @@ class VariationalBayes(object):
 
         return mu_post_vbis, var_post_vbis, log_c_hat
 
+    def batch_vb_update(self, measurements, likelihood, prior_means,
+                        prior_covariances, init_alpha=0.5, init_xi=1,
+                        return_variational=False):
+        """Variational bayes update for many Gaussian/Softmax pairs at once.
+
+        Runs the same EM iterations as `vb_update`, but over K stacked pairs
+        of Gaussian priors and measured classes of one softmax model. Pairs
+        whose log_c_hat has converged are masked out of later EM steps.
+
+        Parameters
+        ----------
+        measurements : list of str
+            The measured (sub)class label for each of the K pairs.
+        likelihood : Softmax
+            The softmax model shared by all pairs.
+        prior_means : array_like
+            (K, d) array of prior means.
+        prior_covariances : array_like
+            (K, d, d) array of prior covariances.
+        init_alpha : float or array_like, optional
+            Initial alpha, or a (K,) array of per-pair initial alphas.
+        init_xi : float or array_like, optional
+            Initial xis, broadcastable to (K, m) for m softmax classes.
+        return_variational : bool, optional
+            Also return the final (K,) alphas and (K, m) xis.
+
+        Returns
+        -------
+        tuple
+            (K, d) posterior means, (K, d, d) posterior covariances and (K,)
+            log normalizing constant estimates.
+        """
+        if hasattr(likelihood, 'subclasses'):
+            m = likelihood.num_subclasses
+            classes = likelihood.subclasses
+        else:
+            m = likelihood.num_classes
+            classes = likelihood.classes
+        j = np.array([classes[measurement].id for measurement in measurements])
+
+        prior_means = np.asarray(prior_means, dtype=np.float)
+        prior_covariances = np.asarray(prior_covariances, dtype=np.float)
+        K, d = prior_means.shape
+
+        w, b = likelihood.world_parameters()
+        dummy_weights = np.zeros((w.shape[0], d - w.shape[1]))
+        w = np.hstack((w, dummy_weights))
+
+        # Prior precision terms are constant across EM steps
+        prior_chol = np.linalg.cholesky(prior_covariances)
+        K_p = cho_inverse(prior_chol)
+        h_p = np.einsum('kij,kj->ki', K_p, prior_means)
+        logdet_prior_var = 2 * np.log(np.diagonal(prior_chol, axis1=1,
+                                                  axis2=2)).sum(axis=-1)
+        w_not_j = w.sum(axis=0) - w[j]
+
+        xis = np.ones((K, m)) * init_xi
+        alpha = np.ones(K) * init_alpha
+        mu_hat = prior_means.copy()
+        var_hat = prior_covariances.copy()
+        log_c_hat = np.zeros(K)
+        prev_log_c_hat = np.ones(K) * -1000  # Arbitrary value
+        active = np.arange(K)
+
+        EM_step = 0
+        while active.size > 0 and EM_step < self.max_EM_steps:
+            a = active
+            ################################################################
+            # STEP 1 - EXPECTATION
+            ################################################################
+            lambdas = self._lambda(xis[a])
+
+            h_j = 0.5 * (w[j[a]] - w_not_j[a]) \
+                + 2 * (lambdas * (alpha[a, None] - b)) .dot (w)
+            K_j = 2 * np.einsum('kc,ci,cj->kij', lambdas, w, w)
+
+            h_l = h_p[a] + h_j
+            K_l = K_p[a] + K_j
+
+            K_l_chol = np.linalg.cholesky(K_l)
+            var_a = cho_inverse(K_l_chol)
+            mu_a = np.einsum('kij,kj->ki', var_a, h_l)
+
+            y_cs = mu_a .dot (w.T) + b
+            second_moment = var_a + mu_a[:, :, None] * mu_a[:, None, :]
+            y_cs_squared = np.einsum('ci,kij,cj->kc', w, second_moment, w) \
+                + 2 * (y_cs - b) * b + b ** 2
+
+            ################################################################
+            # STEP 2 - MAXIMIZATION
+            ################################################################
+            alpha_a = alpha[a]
+            for i in range(self.num_EM_convergence_loops):  # n_{lc}
+                xis_a = np.sqrt(y_cs_squared + alpha_a[:, None] ** 2
+                                - 2 * alpha_a[:, None] * y_cs)
+                lambdas = self._lambda(xis_a)
+                alpha_a = ((m - 2) / 4 + (lambdas * y_cs).sum(axis=-1)) \
+                    / lambdas.sum(axis=-1)
+
+            ################################################################
+            # STEP 3 - CONVERGENCE CHECK
+            ################################################################
+            logdet_var_hat = -2 * np.log(np.diagonal(K_l_chol, axis1=1,
+                                                     axis2=2)).sum(axis=-1)
+            mean_diff = prior_means[a] - mu_a
+            KLD = 0.5 * (logdet_prior_var[a] - logdet_var_hat +
+                         np.einsum('kij,kji->k', K_p[a], var_a) +
+                         np.einsum('ki,kij,kj->k', mean_diff, K_p[a],
+                                   mean_diff))
+
+            sum1 = np.sum(0.5 * (alpha_a[:, None] + xis_a - y_cs)
+                          - lambdas * (y_cs_squared - 2 * alpha_a[:, None]
+                                       * y_cs + alpha_a[:, None] ** 2
+                                       - xis_a ** 2)
+                          - np.log(1 + np.exp(xis_a)), axis=-1)
+            log_c_a = y_cs[np.arange(a.size), j[a]] - alpha_a + sum1 - KLD + 1
+
+            xis[a] = xis_a
+            alpha[a] = alpha_a
+            mu_hat[a] = mu_a
+            var_hat[a] = var_a
+            log_c_hat[a] = log_c_a
+
+            converged = np.abs(log_c_a - prev_log_c_hat[a]) \
+                < self.EM_convergence_tolerance
+            prev_log_c_hat[a] = log_c_a
+            active = a[~converged]
+            EM_step += 1
+
+        logging.debug('Batched VB update of {} pairs finished after {} EM '
+                      'steps.'.format(K, EM_step))
+
+        if return_variational:
+            return mu_hat, var_hat, log_c_hat, alpha, xis
+        return mu_hat, var_hat, log_c_hat
+
+    def batch_vbis_update(self, measurements, likelihood, prior_means,
+                          prior_covariances, exact_likelihoods=None,
+                          exact_measurements=None, num_samples=None,
+                          use_LWIS=False, random_state=None, init_alpha=0.5,
+                          init_xi=1, return_variational=False):
+        """VB update with importance sampling for many pairs at once.
+
+        Batched counterpart of `vbis_update`: all K pairs share one VB solve
+        (see `batch_vb_update`) and one softmax evaluation per measured
+        label for the importance sampling correction.
+
+        Samples are drawn in batches of `importance_batch_size`. A pair
+        stops sampling once it has `min_importance_samples`, its effective
+        sample size reaches `target_ess` and its mean moved by less than
+        `moment_tolerance` standard deviations in the last batch. No pair
+        uses more than `num_importance_samples` (rounded up to a whole
+        batch), and a given `num_samples` fixes the count for every pair.
+        By default `min_importance_samples` is a quarter of
+        `num_importance_samples`. The sample count of each pair is kept in
+        `importance_samples_used`.
+
+        `init_alpha`, `init_xi` and `return_variational` are passed on to
+        `batch_vb_update`; LWIS updates return their initial values.
+        """
+        if random_state is None:
+            random_state = np.random
+
+        prior_means = np.asarray(prior_means, dtype=np.float)
+        prior_covariances = np.asarray(prior_covariances, dtype=np.float)
+        K, d = prior_means.shape
+
+        if use_LWIS:
+            q_mu = prior_means
+            log_c_hat = np.ones(K) * np.nan
+            alpha = np.ones(K) * init_alpha
+            xis = np.ones((K, likelihood.weights.shape[0])) * init_xi
+        else:
+            q_mu, _, log_c_hat, alpha, xis = \
+                self.batch_vb_update(measurements, likelihood, prior_means,
+                                     prior_covariances, init_alpha, init_xi,
+                                     return_variational=True)
+
+        # Draw samples in batches until each pair's estimate has settled
+        if num_samples is None:
+            min_samples = self.min_importance_samples
+            max_samples = self.num_importance_samples
+        else:
+            min_samples = max_samples = num_samples
+        batch_size = min(self.importance_batch_size, max_samples)
+        num_batches = -(-max_samples // batch_size)
+        z = standard_normal_draws((K, num_batches * batch_size, d),
+                                  random_state, self.sampling)
+        x = np.empty_like(z)
+        log_w = np.empty(z.shape[:2])
+
+        # Importance distributions share the prior covariances, so the
+        # prior-to-proposal density ratio only needs the whitened samples
+        prior_chol = np.linalg.cholesky(prior_covariances)
+        offset = np.linalg.solve(prior_chol,
+                                 (q_mu - prior_means)[..., None])[..., 0]
+
+        measurements = np.asarray(measurements)
+        mu_hat = np.empty((K, d))
+        var_hat = np.empty((K, d, d))
+        ess = np.empty(K)
+        used_samples = np.empty(K, dtype=np.int)
+        active = np.arange(K)
+        n = 0
+        while active.size > 0:
+            new = slice(n, n + batch_size)
+            z_a = z[active, new]
+            x[active, new] = q_mu[active, None, :] \
+                + np.einsum('kij,ksj->ksi', prior_chol[active], z_a)
+            u = z_a + offset[active, None, :]
+            log_w[active, new] = 0.5 * ((z_a ** 2).sum(axis=-1)
+                                        - (u ** 2).sum(axis=-1))
+
+            # Evaluate the likelihood once per distinct measurement
+            for measurement in np.unique(measurements[active]):
+                pairs = active[measurements[active] == measurement]
+                p = self._measurement_likelihood(
+                    measurement, likelihood, x[pairs, new].reshape(-1, d),
+                    exact_likelihoods, exact_measurements)
+                with np.errstate(divide='ignore'):
+                    log_w[pairs, new] += np.log(p).reshape(pairs.size, -1)
+            n += batch_size
+
+            # Compute parameters using samples
+            w = np.exp(log_w[active, :n]
+                       - log_w[active, :n].max(axis=-1, keepdims=True))
+            mu_a, var_a, ess_a = weighted_moments(x[active, :n], w)
+            if n > batch_size:
+                std_a = np.sqrt(np.diagonal(var_a, axis1=1, axis2=2))
+                shift = np.abs(mu_a - mu_hat[active]) / std_a
+                stable = shift.max(axis=-1) < self.moment_tolerance
+            else:
+                stable = np.zeros(active.size, dtype=np.bool)
+            done = (n >= max_samples) | ((n >= min_samples) & stable &
+                                         (ess_a >= self.target_ess))
+
+            mu_hat[active] = mu_a
+            var_hat[active] = var_a
+            ess[active] = ess_a
+            used_samples[active] = n
+            active = active[~done]
+
+        logging.debug('Batched VBIS used {} to {} samples per pair, with '
+                      'effective sample sizes between {:.1f} and {:.1f}.'
+                      .format(used_samples.min(), used_samples.max(),
+                              ess.min(), ess.max()))
+        self.importance_samples_used = used_samples
+
+        if return_variational:
+            return mu_hat, var_hat, log_c_hat, alpha, xis
+        return mu_hat, var_hat, log_c_hat
+
     def update(self, measurement, likelihood, prior, use_LWIS=False,
                poly=None, num_std=1, get_raw_beta=False, 
                exact_likelihoods=None, exact_measurements=None,):
@@ -443,73 +664,84 @@ class VariationalBayes(object):
                             prior.covariances.shape[2]))
         log_beta_hat = np.zeros(K) # Weight estimates
 
-        for u, mixand_weight in enumerate(prior.weights):
-            mix_sm_corr = 0
-
-            # Check to see if the mixand is completely contained within
-            # the softmax class (i.e. doesn't need an update)
-            mixand = GaussianMixture(1, prior.means[u], prior.covariances[u])
-            logging.debug('prior.means[u]: {}'.format(prior.means[u]))
-            logging.debug('prior.covariances[u]: {}'.format(prior.covariances[u]))
-            logging.debug('mixand.means: {}'.format(mixand.means))
-            logging.debug('mixand.covariances: {}'.format(mixand.covariances))
-            logging.debug('type means: {}'.format(type(prior.means[u])))
-            mixand_samples = mixand.rvs(self.num_mixand_samples)
-            p_hat_ru_samples = likelihood.classes[measurement].probability(state=mixand_samples[:,0:2])
-            # logging.debug('p_hat_ru_samples: {}'.format(p_hat_ru_samples))
-            mix_sm_corr = np.sum(p_hat_ru_samples) / self.num_mixand_samples
-            logging.debug('gm and softmax correlation: {}, threshold: {}'
-                          .format(mix_sm_corr, self.mix_sm_corr_thresh))
-
-            if mix_sm_corr > self.mix_sm_corr_thresh:
-                logging.debug('Mixand {}\'s correspondence with {} was {},'
-                             'above the threshold of {}, so VBIS was skipped.'
-                             .format(u, measurement, mix_sm_corr, self.mix_sm_corr_thresh))
-
-                # Append the prior's parameters to the mixand parameter lists
-                mu_hat[h, :] = prior.means[u]
-                var_hat[h, :] = prior.covariances[u]
-                log_beta_hat[h] = np.log(mixand_weight)
-
-                h +=1
-                continue
-
-            # Otherwise complete the full VBIS update
-            ordered_subclasses = iter(sorted(relevant_subclasses.iteritems()))
-            for label, subclass in ordered_subclasses:
-                # print label
-                # Compute \hat{P}_s(r|u)
-                mixand_samples = mixand.rvs(self.num_mixand_samples)
-                p_hat_ru_samples = subclass.probability(state=mixand_samples)
-                p_hat_ru_sampled = np.sum(p_hat_ru_samples) / self.num_mixand_samples
-                logging.debug('Starting vbis_update')
+        if self.batch_mixands:
+            h = self._batch_update_mixands(measurement, likelihood, prior,
+                                           relevant_subclasses, mu_hat,
+                                           var_hat, log_beta_hat,
+                                           use_LWIS=use_LWIS,
+                                           exact_likelihoods=exact_likelihoods,
+                                           exact_measurements=exact_measurements)
+        else:
+            mixand_samples = np.empty((self.num_mixand_samples, prior.ndims))
+            for u, mixand_weight in enumerate(prior.weights):
+                mix_sm_corr = 0
+
+                # Check to see if the mixand is completely contained within
+                # the softmax class (i.e. doesn't need an update)
+                mixand = GaussianMixture.from_arrays(np.ones(1),
+                                                     prior.means[u:u + 1],
+                                                     prior.covariances[u:u + 1])
+                logging.debug('prior.means[u]: {}'.format(prior.means[u]))
+                logging.debug('prior.covariances[u]: {}'.format(prior.covariances[u]))
                 logging.debug('mixand.means: {}'.format(mixand.means))
                 logging.debug('mixand.covariances: {}'.format(mixand.covariances))
-                mu_vbis, var_vbis, log_c_hat = \
-                    self.vbis_update(label, subclass.softmax_collection,
-                                     mixand, use_LWIS=use_LWIS,
-                                     exact_likelihoods=exact_likelihoods,
-                                     exact_measurements=exact_measurements,
-                                     )
-                logging.debug('Finished vbis_update')
-
-                # Compute log odds of r given u
-                if np.isnan(log_c_hat):  # from LWIS update
-                    log_p_hat_ru = np.log(p_hat_ru_sampled)
-                else:
-                    log_p_hat_ru = np.max((log_c_hat, np.log(p_hat_ru_sampled)))
-
-                # Find log of P(u,r|D_k) \approxequal \hat{B}_{ur}
-                log_beta_vbis = np.log(mixand_weight) + log_p_hat_ru
-
-                # Symmetrize var_vbis
-                var_vbis = 0.5 * (var_vbis.T + var_vbis)
-
-                # Update estimate values
-                log_beta_hat[h] = log_beta_vbis
-                mu_hat[h,:] = mu_vbis
-                var_hat[h,:] = var_vbis
-                h += 1
+                logging.debug('type means: {}'.format(type(prior.means[u])))
+                mixand.rvs(self.num_mixand_samples, out=mixand_samples)
+                p_hat_ru_samples = likelihood.classes[measurement].probability(state=mixand_samples[:,0:2])
+                # logging.debug('p_hat_ru_samples: {}'.format(p_hat_ru_samples))
+                mix_sm_corr = np.sum(p_hat_ru_samples) / self.num_mixand_samples
+                logging.debug('gm and softmax correlation: {}, threshold: {}'
+                              .format(mix_sm_corr, self.mix_sm_corr_thresh))
+
+                if mix_sm_corr > self.mix_sm_corr_thresh:
+                    logging.debug('Mixand {}\'s correspondence with {} was {},'
+                                 'above the threshold of {}, so VBIS was skipped.'
+                                 .format(u, measurement, mix_sm_corr, self.mix_sm_corr_thresh))
+
+                    # Append the prior's parameters to the mixand parameter lists
+                    mu_hat[h, :] = prior.means[u]
+                    var_hat[h, :] = prior.covariances[u]
+                    log_beta_hat[h] = np.log(mixand_weight)
+
+                    h +=1
+                    continue
+
+                # Otherwise complete the full VBIS update
+                ordered_subclasses = iter(sorted(relevant_subclasses.iteritems()))
+                for label, subclass in ordered_subclasses:
+                    # print label
+                    # Compute \hat{P}_s(r|u)
+                    mixand.rvs(self.num_mixand_samples, out=mixand_samples)
+                    p_hat_ru_samples = subclass.probability(state=mixand_samples)
+                    p_hat_ru_sampled = np.sum(p_hat_ru_samples) / self.num_mixand_samples
+                    logging.debug('Starting vbis_update')
+                    logging.debug('mixand.means: {}'.format(mixand.means))
+                    logging.debug('mixand.covariances: {}'.format(mixand.covariances))
+                    mu_vbis, var_vbis, log_c_hat = \
+                        self.vbis_update(label, subclass.softmax_collection,
+                                         mixand, use_LWIS=use_LWIS,
+                                         exact_likelihoods=exact_likelihoods,
+                                         exact_measurements=exact_measurements,
+                                         )
+                    logging.debug('Finished vbis_update')
+
+                    # Compute log odds of r given u
+                    if np.isnan(log_c_hat):  # from LWIS update
+                        log_p_hat_ru = np.log(p_hat_ru_sampled)
+                    else:
+                        log_p_hat_ru = np.max((log_c_hat, np.log(p_hat_ru_sampled)))
+
+                    # Find log of P(u,r|D_k) \approxequal \hat{B}_{ur}
+                    log_beta_vbis = np.log(mixand_weight) + log_p_hat_ru
+
+                    # Symmetrize var_vbis
+                    var_vbis = 0.5 * (var_vbis.T + var_vbis)
+
+                    # Update estimate values
+                    log_beta_hat[h] = log_beta_vbis
+                    mu_hat[h,:] = mu_vbis
+                    var_hat[h,:] = var_vbis
+                    h += 1
 
         # Renormalize and truncate (based on weight threshold)
         raw_beta_hats = np.exp(log_beta_hat)
@@ -558,6 +790,320 @@ class VariationalBayes(object):
 
         return mu_hat, var_hat, beta_hat
 
+    def _batch_update_mixands(self, measurement, likelihood, prior,
+                              relevant_subclasses, mu_hat, var_hat,
+                              log_beta_hat, use_LWIS=False,
+                              exact_likelihoods=None, exact_measurements=None):
+        """Fill the posterior mixand parameters using batched VBIS updates.
+
+        Mixands are written to `mu_hat`, `var_hat` and `log_beta_hat` in the
+        same order as the serial loop in `update`. Returns the number of
+        posterior mixands written.
+
+        Mixands needing an update are split into chunks of
+        `mixands_per_task`, each with its own seed. If `num_workers` > 1 and
+        at least `min_parallel_mixands` mixands need an update, the chunks
+        run on the instance's process pool (see `close`). The results don't
+        depend on the number of workers.
+
+        Unless exact likelihoods are given, each mixand's result is cached
+        (see `cache_size`), and new VB solves start from the alphas and xis
+        of the cached mixand closest to them.
+        """
+        n = prior.weights.size
+        log_weights = np.log(prior.weights)
+        ordered_subclasses = sorted(relevant_subclasses.iteritems())
+        k = len(ordered_subclasses)
+
+        # Look up previous results for the same mixands and likelihood
+        use_cache = self.cache_size > 0 and exact_likelihoods is None
+        entries = [None] * n
+        if use_cache:
+            method = 'lwis' if use_LWIS else 'vbis'
+            family = (measurement, method, softmax_digest(likelihood))
+            keys = [self._cache_key(family, prior.means[u],
+                                    prior.covariances[u]) for u in range(n)]
+            entries = [self._cache_get(key) for key in keys]
+        misses = np.array([u for u in range(n) if entries[u] is None],
+                          dtype=np.int)
+
+        # Check which mixands are contained within the softmax class
+        samples, sample_weights = self._overlap_points(prior, misses,
+                                                       likelihood)
+        flat_samples = samples.reshape(-1, samples.shape[-1])
+        p_hat_ru_samples = likelihood.classes[measurement]\
+            .probability(state=flat_samples[:, 0:2])
+        mix_sm_corr = np.reshape(p_hat_ru_samples, samples.shape[:2])\
+            .dot(sample_weights)
+        skipped = mix_sm_corr > self.mix_sm_corr_thresh
+        logging.debug('Mixands {} were above the correspondence threshold of '
+                      '{} with {}, so VBIS was skipped.'
+                      .format(misses[skipped], self.mix_sm_corr_thresh,
+                              measurement))
+        for u in misses[skipped]:
+            entries[u] = {'skipped': True}
+
+        # Warm start the VB solves from the closest cached solutions
+        updated = misses[~skipped]
+        collections = set(id(subclass.softmax_collection)
+                          for _, subclass in ordered_subclasses)
+        init_alpha = 0.5
+        init_xi = 1
+        if use_cache and len(collections) == 1 and not use_LWIS:
+            m = ordered_subclasses[0][1].softmax_collection.weights.shape[0]
+            init_alpha = np.ones((updated.size, k)) * 0.5
+            init_xi = np.ones((updated.size, k, m))
+            for i, u in enumerate(updated):
+                nearest = self._cache_nearest(family, prior.means[u])
+                if nearest is not None:
+                    init_alpha[i] = nearest['alpha']
+                    init_xi[i] = nearest['xis']
+            init_alpha = init_alpha.reshape(-1)
+            init_xi = init_xi.reshape(updated.size * k, m)
+
+        # Update the remaining mixands in seeded chunks
+        chunks = [np.arange(i, min(i + self.mixands_per_task, updated.size))
+                  for i in range(0, updated.size, self.mixands_per_task)]
+        seeds = self.random_state.randint(2 ** 31 - 1, size=len(chunks))
+        tasks = zip(chunks, seeds)
+        worker_state = [self, ordered_subclasses, prior.means[updated],
+                        prior.covariances[updated], samples[~skipped],
+                        init_alpha, init_xi,
+                        {'use_LWIS': use_LWIS,
+                         'exact_likelihoods': exact_likelihoods,
+                         'exact_measurements': exact_measurements,
+                         'sample_weights': sample_weights}]
+
+        if self.num_workers > 1 and len(chunks) > 1 \
+                and updated.size >= self.min_parallel_mixands:
+            # Workers don't need the cache or the random state
+            worker_vb = copy(self)
+            worker_vb._cache = OrderedDict()
+            worker_vb.random_state = None
+            worker_state[0] = worker_vb
+
+            # The softmax models reach each worker once, with one group of
+            # chunks per worker, rather than with every chunk
+            num_groups = min(self.num_workers, len(chunks))
+            groups = [(worker_state, tasks[i::num_groups])
+                      for i in range(num_groups)]
+            group_results = self._get_pool().map(_vbis_tasks, groups)
+            results = [None] * len(chunks)
+            for i, group_result in enumerate(group_results):
+                results[i::num_groups] = group_result
+        else:
+            results = [_vbis_task(task, worker_state) for task in tasks]
+
+        if results:
+            mu_pairs, var_pairs, log_p_hat_ru, alphas, xis = \
+                [np.concatenate(r) for r in zip(*results)]
+        for i, u in enumerate(updated):
+            pairs = slice(i * k, (i + 1) * k)
+            entries[u] = {'skipped': False,
+                          'mean': prior.means[u],
+                          'mu': mu_pairs[pairs],
+                          'var': var_pairs[pairs],
+                          'log_p': log_p_hat_ru[pairs],
+                          'alpha': alphas[pairs],
+                          'xis': xis[pairs],
+                          }
+
+        if use_cache:
+            for u in misses:
+                entries[u]['family'] = family
+                self._cache_put(keys[u], entries[u])
+
+        # Write the results in mixand order
+        h = 0
+        for u, entry in enumerate(entries):
+            if entry['skipped']:
+                mu_hat[h] = prior.means[u]
+                var_hat[h] = prior.covariances[u]
+                log_beta_hat[h] = log_weights[u]
+                h += 1
+                continue
+            mu_hat[h:h + k] = entry['mu']
+            var_hat[h:h + k] = entry['var']
+            log_beta_hat[h:h + k] = log_weights[u] + entry['log_p']
+            h += k
+
+        return h
+
+    def _overlap_points(self, prior, mixands, likelihood):
+        """Points and weights to estimate E[P(class|x)] under each mixand.
+
+        With `overlap_method='sampling'` these are `num_mixand_samples`
+        random draws with equal weights. 'unscented' uses sigma points and
+        'gauss-hermite' a cubature rule of order `cubature_order`. Both
+        are deterministic and only span the softmax model's dimensions, but
+        low orders are biased for softmax boundaries much sharper than the
+        mixand.
+        """
+        if self.overlap_method == 'sampling':
+            num_samples = self.num_mixand_samples
+            chol = np.linalg.cholesky(prior.covariances[mixands])
+            z = standard_normal_draws((mixands.size, num_samples, prior.ndims),
+                                      self.random_state, self.sampling)
+            samples = prior.means[mixands, None, :] \
+                + np.einsum('kij,ksj->ksi', chol, z)
+            return samples, np.ones(num_samples) / num_samples
+
+        d = likelihood.weights.shape[1]
+        marginal = GaussianMixture.from_arrays(
+            np.ones(mixands.size), prior.means[mixands, :d],
+            prior.covariances[mixands, :d, :d])
+        if self.overlap_method == 'unscented':
+            return marginal.sigma_points()
+        return marginal.gauss_hermite_points(self.cubature_order)
+
+    def _vbis_mixands(self, ordered_subclasses, means, covariances, samples,
+                      random_state, use_LWIS=False, exact_likelihoods=None,
+                      exact_measurements=None, init_alpha=0.5, init_xi=1,
+                      sample_weights=None):
+        """Batched VBIS update of every pair of the given mixands.
+
+        `samples` are the (n, num_samples, d) points of each mixand, with
+        `sample_weights` (uniform by default), that were already used for
+        its correspondence check. `init_alpha` and
+        `init_xi` may hold per-pair values, ordered like the results.
+
+        Returns the pairs' means, covariances, log P(r|u) estimates, alphas
+        and xis, ordered by mixand and then by subclass.
+        """
+        n, d = means.shape
+        k = len(ordered_subclasses)
+        pair_mixands = np.repeat(np.arange(n), k)
+        pair_subclasses = np.tile(np.arange(k), n)
+        mu_pairs = np.empty((n * k, d))
+        var_pairs = np.empty((n * k, d, d))
+        log_p_hat_ru = np.empty(n * k)
+        alpha_pairs = np.empty(n * k)
+        xi_pairs = [None] * (n * k)
+
+        # Compute \hat{P}_s(r|u) from each mixand's samples
+        num_samples = samples.shape[1]
+        if sample_weights is None:
+            sample_weights = np.ones(num_samples) / num_samples
+        flat_samples = samples.reshape(-1, samples.shape[-1])
+        tiny = np.finfo(float).tiny
+        for s, (label, subclass) in enumerate(ordered_subclasses):
+            p = subclass.probability(state=flat_samples)
+            p_hat_ru = np.reshape(p, (n, num_samples)).dot(sample_weights)
+            log_p_hat_ru[s::k] = np.log(np.maximum(p_hat_ru, tiny))
+
+        # Pairs are solved together for each softmax model
+        collections = {}
+        for s, (label, subclass) in enumerate(ordered_subclasses):
+            collection = subclass.softmax_collection
+            collections.setdefault(id(collection), (collection, []))[1]\
+                .append(s)
+
+        for collection, subclass_ids in collections.itervalues():
+            pairs = np.nonzero(np.in1d(pair_subclasses, subclass_ids))[0]
+            labels = [ordered_subclasses[s][0] for s in pair_subclasses[pairs]]
+            if np.ndim(init_alpha) > 0:
+                pair_alpha = init_alpha[pairs]
+                pair_xi = init_xi[pairs]
+            else:
+                pair_alpha = init_alpha
+                pair_xi = init_xi
+            mu_vbis, var_vbis, log_c_hat, alpha, xis = \
+                self.batch_vbis_update(labels, collection,
+                                       means[pair_mixands[pairs]],
+                                       covariances[pair_mixands[pairs]],
+                                       exact_likelihoods=exact_likelihoods,
+                                       exact_measurements=exact_measurements,
+                                       use_LWIS=use_LWIS,
+                                       random_state=random_state,
+                                       init_alpha=pair_alpha,
+                                       init_xi=pair_xi,
+                                       return_variational=True)
+
+            # Compute log odds of r given u
+            if not use_LWIS:
+                log_p_hat_ru[pairs] = np.fmax(log_c_hat, log_p_hat_ru[pairs])
+            mu_pairs[pairs] = mu_vbis
+            var_pairs[pairs] = 0.5 * (var_vbis + var_vbis.transpose(0, 2, 1))
+            alpha_pairs[pairs] = alpha
+            for i, pair in enumerate(pairs):
+                xi_pairs[pair] = xis[i]
+
+        if len(collections) == 1:
+            xi_pairs = np.array(xi_pairs).reshape(n * k, -1)
+        else:
+            xi_pairs = np.array(xi_pairs, dtype=object)
+
+        return mu_pairs, var_pairs, log_p_hat_ru, alpha_pairs, xi_pairs
+
+    def _cache_key(self, family, mean, covariance):
+        """Hash a mixand, rounded to `cache_tolerance`, with its likelihood."""
+        digest = hashlib.sha1(repr(family))
+        for array in (mean, covariance):
+            rounded = np.round(np.asarray(array) / self.cache_tolerance)
+            digest.update(rounded.astype(np.int64).tostring())
+        return digest.hexdigest()
+
+    def _cache_get(self, key):
+        try:
+            entry = self._cache.pop(key)
+        except KeyError:
+            self.cache_misses += 1
+            return None
+        self._cache[key] = entry  # Most recently used
+        self.cache_hits += 1
+        return entry
+
+    def _cache_put(self, key, entry):
+        self._cache[key] = entry
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cache_nearest(self, family, mean):
+        """Cached VB solution of the same likelihood closest to `mean`."""
+        nearest = None
+        nearest_distance = np.inf
+        for entry in self._cache.itervalues():
+            if entry['family'] != family or entry['skipped'] \
+                    or np.isnan(entry['alpha']).any():
+                continue
+            distance = np.sum((entry['mean'] - mean) ** 2)
+            if distance < nearest_distance:
+                nearest = entry
+                nearest_distance = distance
+        return nearest
+
+    def clear_cache(self):
+        """Empty the VBIS result cache and reset its counters."""
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _measurement_likelihood(self, measurement, likelihood, x,
+                                exact_likelihoods=None,
+                                exact_measurements=None):
+        """Likelihood of a measured (sub)class at each state in `x`."""
+        if exact_likelihoods is None:
+            if hasattr(likelihood, 'subclasses'):
+                measurement_class = likelihood.subclasses[measurement]
+            else:
+                measurement_class = likelihood.classes[measurement]
+            return measurement_class.probability(state=x)
+
+        for i, exact_likelihood in enumerate(exact_likelihoods):
+            if hasattr(exact_likelihood, 'subclasses'):
+                exact_measurement_class = \
+                    exact_likelihood.subclasses[exact_measurements[i]]
+            else:
+                exact_measurement_class = \
+                    exact_likelihood.classes[exact_measurements[i]]
+
+            if i == 0:
+                likelihood_at_x = np.ones(x.shape[0])
+            else:
+                likelihood_at_x = likelihood_at_x \
+                    * exact_measurement_class.probability(state=x)
+        return likelihood_at_x
+
     def _lambda(self, xi_c):
         return 1 / (2 * xi_c) * ( (1 / (1 + np.exp(-xi_c))) - 0.5)
 
@@ -591,6 +1137,154 @@ class VariationalBayes(object):
         return xis, alpha, mu_hat, var_hat, prior_mean, prior_var
 
 
+def softmax_digest(softmax):
+    """Hash of a softmax model's world-frame weights and biases."""
+    digest = hashlib.sha1()
+    for array in softmax.world_parameters():
+        digest.update(np.ascontiguousarray(array, dtype=np.float).tostring())
+    return digest.hexdigest()
+
+
+def standard_normal_draws(size, random_state=None, sampling='random'):
+    """Standard normal draws of shape (..., n, d).
+
+    With `sampling='sobol'` every leading index gets its own randomly
+    (digitally) shifted Sobol sequence of n points in d <= 10 dimensions,
+    mapped through the normal quantile function.
+    """
+    if random_state is None:
+        random_state = np.random
+    if sampling == 'random':
+        return random_state.standard_normal(size)
+
+    n, d = size[-2:]
+    num_streams = int(np.prod(size[:-2]))
+    points = sobol_sequence(n, d)
+
+    # XOR the shared sequence with a random shift for each stream
+    shifts = (random_state.uniform(size=(num_streams, 1, d))
+              * 2 ** _sobol_bits).astype(np.uint64)
+    points = (points ^ shifts) / 2 ** _sobol_bits
+    eps = np.finfo(float).eps
+    draws = norm.ppf(np.clip(points, eps, 1 - eps))
+    return draws.reshape(size)
+
+
+# Sobol sequence degree, polynomial and initial direction numbers for
+# dimensions 2 to 10, from Joe and Kuo's new-joe-kuo-6.21201 table
+_sobol_parameters = [(1, 0, [1]),
+                     (2, 1, [1, 3]),
+                     (3, 1, [1, 3, 1]),
+                     (3, 2, [1, 1, 1]),
+                     (4, 1, [1, 1, 3, 3]),
+                     (4, 4, [1, 3, 5, 13]),
+                     (5, 2, [1, 1, 5, 5, 17]),
+                     (5, 4, [1, 1, 5, 5, 5]),
+                     (5, 7, [1, 1, 7, 11, 19]),
+                     ]
+_sobol_bits = 32
+
+
+def sobol_sequence(n, d):
+    """First n points of the d-dimensional Sobol sequence, as integers.
+
+    The points are the unsigned integers of `_sobol_bits` bits whose
+    fractions (divided by 2 ** `_sobol_bits`) are the Sobol points in the
+    unit cube, starting from the origin.
+    """
+    if d > len(_sobol_parameters) + 1:
+        raise ValueError('Sobol sequences are only available for up to {} '
+                         'dimensions.'.format(len(_sobol_parameters) + 1))
+
+    # Direction numbers of each dimension
+    L = _sobol_bits
+    directions = np.empty((d, L), dtype=np.uint64)
+    directions[0] = [1 << (L - 1 - k) for k in range(L)]
+    for j in range(1, d):
+        s, a, m = _sobol_parameters[j - 1]
+        v = directions[j]
+        for k in range(L):
+            if k < s:
+                v[k] = m[k] << (L - 1 - k)
+                continue
+            v[k] = v[k - s] ^ (v[k - s] >> np.uint64(s))
+            for i in range(1, s):
+                if (a >> (s - 1 - i)) & 1:
+                    v[k] ^= v[k - i]
+
+    # Gray code order, so each point's bits pick its direction numbers
+    i = np.arange(n, dtype=np.uint64)
+    gray = i ^ (i >> np.uint64(1))
+    points = np.zeros((n, d), dtype=np.uint64)
+    for k in range(L):
+        bit = (gray >> np.uint64(k)) & np.uint64(1)
+        points ^= bit[:, None] * directions[:, k]
+    return points
+
+
+def cho_inverse(chol):
+    """Inverses of (..., d, d) matrices from their lower Cholesky factors.
+
+    Like `cho_solve(factor, eye)` in `vb_update`, this solves against each
+    factor rather than inverting the matrices themselves.
+    """
+    eye = np.broadcast_to(np.eye(chol.shape[-1]), chol.shape)
+    inv_chol = np.linalg.solve(chol, eye)
+    return np.einsum('...ki,...kj->...ij', inv_chol, inv_chol)
+
+
+def weighted_moments(samples, weights):
+    """Weighted mean and covariance of (possibly batched) samples.
+
+    Parameters
+    ----------
+    samples : array_like
+        (..., n, d) array of samples; leading dimensions are batches.
+    weights : array_like
+        (..., n) array of non-negative, possibly unnormalized, weights.
+
+    Returns
+    -------
+    tuple
+        The (..., d) means, (..., d, d) covariances and (...) effective
+        sample sizes, 1 / sum(w ** 2) for the normalized weights.
+    """
+    samples = np.asarray(samples, dtype=np.float)
+    weights = np.asarray(weights, dtype=np.float)
+    weights = weights / weights.sum(axis=-1, keepdims=True)
+
+    mean = np.einsum('...n,...ni->...i', weights, samples)
+    centered = samples - mean[..., None, :]
+    covariance = np.einsum('...n,...ni,...nj->...ij', weights, centered,
+                           centered)
+    ess = 1 / (weights ** 2).sum(axis=-1)
+    return mean, covariance, ess
+
+
+def _vbis_tasks(group):
+    """Run the batched VBIS updates of a group of seeded chunks in a pool
+    worker.
+    """
+    worker_state, tasks = group
+    return [_vbis_task(task, worker_state) for task in tasks]
+
+
+def _vbis_task(task, worker_state):
+    """Run the batched VBIS update for one seeded chunk of mixands."""
+    vb, ordered_subclasses, means, covariances, samples, init_alpha, \
+        init_xi, kwargs = worker_state
+    mixand_ids, seed = task
+    if np.ndim(init_alpha) > 0:
+        k = len(ordered_subclasses)
+        pairs = (mixand_ids[:, None] * k + np.arange(k)).ravel()
+        init_alpha = init_alpha[pairs]
+        init_xi = init_xi[pairs]
+    return vb._vbis_mixands(ordered_subclasses, means[mixand_ids],
+                            covariances[mixand_ids], samples[mixand_ids],
+                            np.random.RandomState(seed),
+                            init_alpha=init_alpha, init_xi=init_xi, **kwargs)
+
+
 def comparison_1d():
 
     # Define prior 
@@ -171,21 +171,38 @@ class SpatialRelationStatement(Statement):
         else:
             self.softmax_class_label = sr_label
 
-        # Create either type of spatial relation softmax model
+        # Create either type of spatial relation softmax model, once per
+        # grounding, and share it with all other statements about it
         #<>TODO: grab labels from models themselves
         #<>TODO: get binary models including label and not-label only
         if sr_label in ['Near','Inside','Outside']:
-            binary_sm = binary_range_model(grounding_obj.shape,
-                                              bounds=map_bounds,
-                                              container_poly=container_poly,
-                                              )
+            model_name = 'range'
         elif sr_label in ['Front', 'Right', 'Back', 'Left']:
-            binary_sm = binary_intrinsic_space_model(grounding_obj.shape,
-                                                        bounds=map_bounds,
-                                                        container_poly=container_poly,
-                                                        )
+            model_name = 'intrinsic'
         else:
             logging.error('No softmax model available!')
+        if container_poly is None:
+            container_key = None
+        else:
+            container_key = container_poly.wkb
+        key = (id(grounding_obj), model_name, container_key)
+
+        try:
+            binary_sm = self.map.relation_models[key]
+        except KeyError:
+            if model_name == 'range':
+                binary_sm = binary_range_model(grounding_obj.shape,
+                                               bounds=map_bounds,
+                                               container_poly=container_poly,
+                                               cache=load_if_possible,
+                                               )
+            else:
+                binary_sm = binary_intrinsic_space_model(grounding_obj.shape,
+                                                         bounds=map_bounds,
+                                                         container_poly=container_poly,
+                                                         cache=load_if_possible,
+                                                         )
+            self.map.relation_models[key] = binary_sm
         self.softmax = binary_sm.get_single_model(self.softmax_class_label)
 
 class ActionStatement(Statement):
@@ -108,6 +108,9 @@ class Map(object):
                              'static': self.static_elements,
                              'information': self.information_elements}
 
+        # Relation models shared by all statements about the same element
+        self.relation_models = {}
+
         # Define layers
         self.shape_layer = ShapeLayer(self.element_dict, bounds=self.bounds)
         self.feasible_layer = FeasibleLayer(bounds=self.bounds)
@@ -80,6 +80,7 @@ class Cop(Robot):
     fusion_engine_defaults = {'probability_type': 'gauss sum',
                               'use_STM': False,
                               'use_velocity': False,
+                              'vb_cfg': {},
                               }
 
     def __init__(self,
@@ -144,6 +145,7 @@ class Cop(Robot):
                                           rosbag_process=rosbag_process,
                                           use_STM=fe_cfg['use_STM'],
                                           use_velocity=fe_cfg['use_velocity'],
+                                          vb_cfg=fe_cfg['vb_cfg'],
                                           )
         self.sensors = {}
         self.ask_every_n = ask_every_n
@@ -348,7 +348,11 @@ class GoalPlanner(object):
 
         # Find the point of maximum a posteriori probability
         try:
-            MAP_point, MAP_prob = posterior.find_MAP()
+            if isinstance(posterior, GaussianMixture):
+                MAP_point, MAP_prob = posterior.find_MAP(
+                    feasible_region=self.feasible_layer.pose_region)
+            else:
+                MAP_point, MAP_prob = posterior.find_MAP()
         except AttributeError, e:
             logging.error(e)
             pt = np.unravel_index(posterior.argmax(), target_filter.X.shape)
@@ -11,6 +11,7 @@ import os
 from sklearn.gaussian_process import GaussianProcess
 
 from cops_and_robots.human_tools.statement_template import get_all_statements
+from cops_and_robots.fusion.gaussian_mixture import GaussianMixture
 
 
 class Questioner(object):
@@ -19,7 +20,7 @@ class Questioner(object):
                  use_ROS=False, repeat_annoyance=0.5, repeat_time_penalty=60,
                  auto_answer=False, sequence_length=1, ask_every_n=0,
                  minimize_questions=False, mask_file='area_masks.npy',
-                 GP_VOI_file='', use_GP_VOI=False):
+                 GP_VOI_file='', use_GP_VOI=False, entropy_mode='grid'):
         self.human_sensor = human_sensor
         self.use_ROS = use_ROS
         self.target_order = target_order
@@ -29,6 +30,7 @@ class Questioner(object):
         self.sequence_length = sequence_length
         self.auto_answer = auto_answer
         self.minimize_questions = minimize_questions
+        self.entropy_mode = entropy_mode
 
         # Set up target order and 
         target_weights = np.asarray(target_weights, dtype=np.float32)
@@ -160,7 +162,10 @@ class Questioner(object):
 
             #Find the entropy and PDF without any questions at K
             posterior.dynamics_update(n_steps=K)
-            posterior_entropy = posterior.entropy()
+            if isinstance(posterior, GaussianMixture):
+                posterior_entropy = posterior.entropy(mode=self.entropy_mode)
+            else:
+                posterior_entropy = posterior.entropy()
             # flat_posterior_pdf = posterior.as_grid().flatten()
 
             # Go through possible question paths
@@ -264,8 +269,14 @@ class Questioner(object):
                 \\left(-\\int p(x \\vert D_i=j) \\log{p(x \\vert D_i=j)}dx\\right)
                 +\\int p(x) \\log{p(x)}dx
 
-        Takes VOI of a specific branch.
+        Takes VOI of a specific branch. If the questioner's `entropy_mode`
+        isn't 'grid' (the default), Gaussian mixture priors are updated with
+        sigma points and use analytic entropies instead.
         """
+        if isinstance(prior, GaussianMixture) and self.entropy_mode != 'grid':
+            return self._calculate_GM_VOI(likelihood_seq_values, prior,
+                                          final_posterior_entropy, timespan)
+
         if probability is None:
             probability = prior.copy()
 
@@ -307,6 +318,72 @@ class Questioner(object):
         VOI = final_posterior_entropy - average_sequence_entropy
         return VOI
 
+    def _calculate_GM_VOI(self, likelihood_seq_values, prior,
+                          final_posterior_entropy, timespan=0):
+        """Calculates VOI without summing over the discretized posterior.
+
+        Each branch posterior stays a Gaussian mixture: every mixand is
+        reweighted and moment-matched to the likelihood at its sigma points,
+        and the branch entropy comes from `GaussianMixture.entropy`.
+        """
+        alpha = self.human_sensor.false_alarm_prob / 2  # only for binary
+        answer_sequences = list(itertools.product([False, True],
+                                                  repeat=self.sequence_length))
+        sequence_entropy = np.empty(len(answer_sequences))
+
+        # Likelihoods are discretized over the prior's grid
+        if not hasattr(prior, 'X'):
+            prior._discretize()
+        x0, y0 = prior.X[0, 0], prior.Y[0, 0]
+        shape = prior.X.shape
+
+        for s, answer_sequence in enumerate(answer_sequences):
+            probability = prior
+            data_likelihood = 1
+
+            for d, answer in enumerate(answer_sequence):
+                pos_likelihood = np.reshape(likelihood_seq_values[d], shape)
+
+                # Look up the likelihood (with human error) at sigma points
+                points, point_weights = probability.sigma_points(kappa=1)
+                i = np.rint((points[..., 0] - x0) / prior.res).astype(np.int)
+                j = np.rint((points[..., 1] - y0) / prior.res).astype(np.int)
+                likelihood = alpha + (1 - alpha) * \
+                    pos_likelihood[np.clip(i, 0, shape[0] - 1),
+                                   np.clip(j, 0, shape[1] - 1)]
+                if not answer:
+                    likelihood = 1 - likelihood
+
+                # Perform a Bayes' update on each mixand
+                point_weights = likelihood * point_weights
+                mixand_likelihood = point_weights.sum(axis=1)
+                weights = probability.weights * mixand_likelihood
+                data_likelihood *= weights.sum()
+                keep = mixand_likelihood > 0
+                point_weights = point_weights[keep] \
+                    / mixand_likelihood[keep, None]
+                points = points[keep]
+
+                means = np.einsum('nk,nki->ni', point_weights, points)
+                diffs = points - means[:, None, :]
+                covariances = np.einsum('nk,nki,nkj->nij', point_weights,
+                                        diffs, diffs)
+                probability = GaussianMixture.from_arrays(
+                    weights[keep] / weights[keep].sum(), means, covariances,
+                    max_num_mixands=int(keep.sum()))
+
+                # Perform dynamics update (one step, as for the grid)
+                if timespan > 0 and d < (len(answer_sequence) - 1):
+                    probability.dynamics_update()
+
+            sequence_entropy[s] = data_likelihood \
+                * probability.entropy(mode=self.entropy_mode)
+
+        average_sequence_entropy = sequence_entropy.sum()
+
+        VOI = final_posterior_entropy - average_sequence_entropy
+        return VOI
+
     def _predict_VOI(self, s):
         question = self.likelihoods[s][0]
         VOI, MSE = self.GPs[question].predict(self.eval_points, eval_MSE=True)
@@ -7,6 +7,7 @@ import matplotlib.animation as animation
 import numpy as np
 
 from scipy.io import loadmat, savemat
+from scipy.stats import multivariate_normal
 
 from cops_and_robots.fusion.gaussian_mixture import (GaussianMixture,
                                                      generate_random_params)
@@ -133,6 +134,56 @@ class TestGaussianMixture:
         plt.show()
         self.check_diff()
 
+    def test_pdf(self, num_mixands=50, num_points=1000):
+        weights, means, covariances = generate_random_params(num_mixands,
+                                                             ndims=2)
+        gm = GaussianMixture(weights, means, covariances,
+                             max_num_mixands=num_mixands)
+        x = np.random.random((num_points, 2)) * 10 - 5
+
+        expected = np.zeros(num_points)
+        for weight, mean, covariance in zip(gm.weights, gm.means,
+                                            gm.covariances):
+            expected += weight * multivariate_normal.pdf(x, mean, covariance)
+
+        # Force chunked evaluation as well
+        gm.max_pdf_chunk_elements = num_mixands * 2 * 64
+        assert np.allclose(gm.pdf(x), expected,
+                           rtol=0, atol=self.diff_tolerance)
+
+    def test_entropy(self, num_mixands=10):
+        # All approximations are exact for a single gaussian
+        covariance = np.array([[2, 0.5], [0.5, 1]])
+        gm = GaussianMixture(1, [1, -1], covariance)
+        H = 0.5 * np.log(np.linalg.det(2 * np.pi * np.e * covariance))
+        for mode in ['lower', 'upper', 'taylor', 'sigma_point']:
+            expected = H
+            if mode == 'lower':
+                expected = H + np.log(2) - 1
+            assert np.isclose(gm.entropy(mode), expected)
+
+        weights, means, covariances = generate_random_params(num_mixands,
+                                                             ndims=2)
+        gm = GaussianMixture(weights, means, covariances,
+                             max_num_mixands=num_mixands)
+        assert gm.entropy('lower') <= gm.entropy('upper')
+
+    def test_copy(self, num_mixands=10):
+        weights, means, covariances = generate_random_params(num_mixands,
+                                                             ndims=2)
+        gm = GaussianMixture(weights, means, covariances,
+                             max_num_mixands=num_mixands)
+        gm._discretize(bounds=[-5, -5, 5, 5], res=0.5)
+        original = gm.prob.copy()
+
+        # Updating a copy's prob in place must leave the original alone
+        gm_copy = gm.copy()
+        prob = gm_copy.prob
+        prob *= 2
+        prob /= prob.sum()
+        assert np.array_equal(gm.prob, original)
+        assert not np.array_equal(gm_copy.prob, original)
+
     def diff(self, python_gm, matlab_gm):
         # Sort everything before comparing
         py_inds = python_gm.weights.argsort()
@@ -0,0 +1,34 @@
+from __future__ import division
+
+import numpy as np
+
+from cops_and_robots.fusion.softmax import _synthesis
+
+
+class TestSynthesis:
+
+    def test_redundant_constraints_2D(self, monkeypatch):
+        # A unit square with a repeated right edge, looser parallel right
+        # and top edges, and a corner cut that only touches the square
+        G = np.array([[1, 0], [0, 1], [1, 0], [-1, 0], [0, -1],
+                      [1, 0], [0, 1], [1, 1]], dtype=float)
+        h = np.array([1, 1, 1, 1, 1, 2, 1.5, 2])
+        result, redundant = _synthesis.find_redundant_constraints(G, h)
+
+        # Force every constraint through its own LP
+        monkeypatch.setattr(_synthesis, '_redundant_constraints_2D',
+                            lambda *args: None)
+        lp_result, lp_redundant = _synthesis.find_redundant_constraints(G, h)
+
+        assert redundant == lp_redundant == [0, 2, 5, 6, 7]
+        for i, (r, lp_r) in enumerate(zip(result, lp_result)):
+            assert r['is redundant'] == lp_r['is redundant']
+            assert np.isclose(r['optimal value'], lp_r['optimal value'])
+            if np.isinf(r['optimal value']):
+                continue
+
+            # The optimum satisfies the other constraints
+            x = r['optimal point']
+            assert np.isclose(G[i].dot(x), r['optimal value'])
+            assert np.all(np.delete(G, i, axis=0).dot(x)
+                          <= np.delete(h, i) + 1E-9)
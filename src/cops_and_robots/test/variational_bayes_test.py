@@ -0,0 +1,144 @@
+from __future__ import division
+
+import numpy as np
+from shapely.geometry import box
+
+from cops_and_robots.fusion.gaussian_mixture import GaussianMixture
+from cops_and_robots.fusion.softmax import (range_model,
+                                            intrinsic_space_model)
+from cops_and_robots.fusion.softmax._models import pentagon_model
+from cops_and_robots.fusion.variational_bayes import (VariationalBayes,
+                                                      sobol_sequence,
+                                                      standard_normal_draws)
+
+
+class TestVariationalBayes:
+
+    def subclassed_problem(self):
+        sm = range_model(box(-1, -1, 1, 1))
+        prior = GaussianMixture([0.3, 0.3, 0.4],
+                                [[0, 1.5], [-2, 0], [1.5, -1.5]],
+                                [[[1, 0.2], [0.2, 0.5]],
+                                 [[0.6, 0], [0, 0.6]],
+                                 [[0.8, -0.3], [-0.3, 1.2]]],
+                                max_num_mixands=3)
+        return sm, prior
+
+    def test_batch_vb_update(self):
+        sm, prior = self.subclassed_problem()
+        labels = sorted(sm.classes['Near'].subclasses.keys())
+
+        # Every mixand paired with every subclass of the measured class
+        measurements = labels * prior.weights.size
+        means = np.repeat(prior.means, len(labels), axis=0)
+        covariances = np.repeat(prior.covariances, len(labels), axis=0)
+        mu, var, log_c = VariationalBayes().batch_vb_update(
+            measurements, sm, means, covariances)
+
+        for k, label in enumerate(measurements):
+            mixand = GaussianMixture.from_arrays(np.ones(1), means[k:k + 1],
+                                                 covariances[k:k + 1])
+            expected = VariationalBayes().vb_update(label, sm, mixand)
+            assert np.allclose(mu[k], expected[0])
+            assert np.allclose(var[k], expected[1])
+            assert np.isclose(log_c[k], expected[2])
+
+    def test_batch_update(self, num_samples=20000):
+        sm, prior = self.subclassed_problem()
+        results = []
+        for batch_mixands in [True, False]:
+            np.random.seed(0)
+            vb = VariationalBayes(batch_mixands=batch_mixands, seed=0,
+                                  num_importance_samples=num_samples,
+                                  num_mixand_samples=num_samples)
+            results.append(vb.update('Near', sm, prior))
+
+        (batch_mu, batch_var, batch_beta), (mu, var, beta) = results
+        assert batch_beta.shape == beta.shape
+        assert np.allclose(batch_mu, mu, atol=0.05)
+        assert np.allclose(batch_var, var, atol=0.05)
+        assert np.allclose(batch_beta, beta, atol=0.01)
+
+    def test_parallel_update(self, num_mixands=20):
+        # A default-sized mixture is large enough to use the worker pool
+        sm = range_model(box(-1, -1, 1, 1))
+        rs = np.random.RandomState(0)
+        prior = GaussianMixture(np.ones(num_mixands) / num_mixands,
+                                rs.uniform(-4, 4, (num_mixands, 2)),
+                                np.tile(np.eye(2) * 0.5, (num_mixands, 1, 1)))
+        assert prior.weights.size == num_mixands
+
+        results = []
+        for num_workers in [1, 2]:
+            vb = VariationalBayes(num_workers=num_workers, seed=0)
+            results.append(vb.update('Near', sm, prior))
+            assert (vb._pool is not None) == (num_workers > 1)
+            vb.close()
+
+        for serial, parallel in zip(*results):
+            assert np.array_equal(serial, parallel)
+
+    def grid_posterior_mean(self, likelihood, label, mean, covariance,
+                            res=0.02):
+        X, Y = np.mgrid[-8:8:res, -8:8:res]
+        pos = np.dstack((X, Y)).reshape(-1, 2)
+        diffs = pos - mean
+        precision = np.linalg.inv(covariance)
+        p = np.exp(-0.5 * np.einsum('ni,ij,nj->n', diffs, precision, diffs))
+        p *= likelihood.classes[label].probability(state=pos)
+        return p.dot(pos) / p.sum()
+
+    def test_importance_sampling_accuracy(self, num_pairs=400):
+        sm = pentagon_model()
+        label = sm.class_labels[1]
+        mean = np.array([0.5, 0.8])
+        covariance = np.array([[1.0, 0.3], [0.3, 0.8]])
+        expected = self.grid_posterior_mean(sm, label, mean, covariance)
+
+        # Repeat one pair to measure the Monte Carlo error of its mean
+        args = ([label] * num_pairs, sm, np.tile(mean, (num_pairs, 1)),
+                np.tile(covariance, (num_pairs, 1, 1)))
+        errors = {}
+        for name, num_samples in [('adaptive', None), ('fixed', 500)]:
+            vb = VariationalBayes()
+            mu, _, _ = vb.batch_vbis_update(
+                *args, num_samples=num_samples,
+                random_state=np.random.RandomState(0))
+            errors[name] = np.sqrt(((mu - expected) ** 2).sum(axis=1).mean())
+
+        assert errors['adaptive'] <= 1.5 * errors['fixed']
+
+    def test_importance_sampling_stops_early(self, num_pairs=20):
+        # Far in front of the box the likelihood is flat, so the importance
+        # weights are even and the moments settle after two batches
+        sm = intrinsic_space_model(box(-1, -1, 1, 1))
+        mean = np.array([8.0, 0.0])
+        covariance = np.eye(2) * 0.3
+        for sampling in ['random', 'sobol']:
+            vb = VariationalBayes(sampling=sampling)
+            mu, var, _ = vb.batch_vbis_update(
+                ['Front'] * num_pairs, sm, np.tile(mean, (num_pairs, 1)),
+                np.tile(covariance, (num_pairs, 1, 1)),
+                random_state=np.random.RandomState(0))
+
+            used = vb.importance_samples_used
+            assert np.median(used) == 2 * vb.importance_batch_size
+            assert used.mean() < 0.75 * vb.num_importance_samples
+            if sampling == 'sobol':
+                assert np.all(used == 2 * vb.importance_batch_size)
+            shift = np.abs(mu - mean) / np.sqrt(np.diag(covariance))
+            assert np.all(shift < 3 * vb.moment_tolerance)
+
+    def test_sobol_draws(self):
+        # The first points of the 2D Sobol sequence
+        points = sobol_sequence(4, 2) / 2 ** 32
+        assert np.allclose(points, [[0, 0], [0.5, 0.5],
+                                    [0.75, 0.25], [0.25, 0.75]])
+
+        z = standard_normal_draws((3, 1024, 2), np.random.RandomState(0),
+                                  sampling='sobol')
+        assert z.shape == (3, 1024, 2)
+        assert np.all(np.isfinite(z))
+        assert np.allclose(z.mean(axis=1), 0, atol=0.02)
+        assert np.allclose(z.std(axis=1), 1, atol=0.02)
+        assert not np.allclose(z[0], z[1])